@@ -1,6 +1,33 @@
 import os
 from datetime import timedelta
 
+
+def database_engine_options(database_uri: str) -> dict:
+    """
+    Engine options (SQLALCHEMY_ENGINE_OPTIONS) read from the environment.
+
+    SQLite does not use a connection pool of a fixed size, so it gets the default options.
+    """
+    if not database_uri or database_uri.startswith('sqlite'):
+        return {}
+
+    options = {
+        'pool_size': int(os.getenv('DATABASE_POOL_SIZE', default=5)),
+        'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', default=10)),
+        'pool_timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', default=30)),
+        # Heroku Postgres closes the idle connections, so recycle them before it does
+        'pool_recycle': int(os.getenv('DATABASE_POOL_RECYCLE', default=1800)),
+        'pool_pre_ping': os.getenv('DATABASE_POOL_PRE_PING', default='true').lower() in ('1', 'true', 'yes'),
+    }
+
+    # Maximum duration of a statement in milliseconds (0 for no limit)
+    statement_timeout = int(os.getenv('DATABASE_STATEMENT_TIMEOUT', default=0))
+    if statement_timeout > 0 and database_uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+
+    return options
+
+
 class Config(object):
     FLASK_ENV = 'development'
     DEBUG = False
@@ -12,6 +39,21 @@ class Config(object):
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = database_engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # Read replica used by the read-only views (unset to send every query to the primary);
+    # a user reads from the primary for DATABASE_REPLICA_STICKY_SECONDS after committing a change
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+        DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', default=10))
+
+    # Connection pool metrics: a checkout waiting longer than DATABASE_POOL_SLOW_CHECKOUT seconds
+    # is logged, and the pool statistics are logged every DATABASE_POOL_METRICS_INTERVAL seconds (0 to disable)
+    DATABASE_POOL_SLOW_CHECKOUT = float(os.getenv('DATABASE_POOL_SLOW_CHECKOUT', default=0.1))
+    DATABASE_POOL_METRICS_INTERVAL = int(os.getenv('DATABASE_POOL_METRICS_INTERVAL', default=300))
+
     WTF_CSRF_ENABLED = True
 
     # If the 'Remember Me' field is selected, then the user will remain logged in for an extended period of time (default value with Flask-Login is one year). 1 year being really long, it's better to set that duration to something more realistic, like 14 days:
@@ -28,6 +70,93 @@ class Config(object):
 
     API_KEY = os.getenv('API_KEY')
 
+    # Alpha Vantage client (one pooled, keep-alive session per worker)
+    ALPHA_VANTAGE_POOL_SIZE = int(os.getenv('ALPHA_VANTAGE_POOL_SIZE', default=10))
+    ALPHA_VANTAGE_CONNECT_TIMEOUT = float(os.getenv('ALPHA_VANTAGE_CONNECT_TIMEOUT', default=3.05))
+    ALPHA_VANTAGE_READ_TIMEOUT = float(os.getenv('ALPHA_VANTAGE_READ_TIMEOUT', default=10))
+    ALPHA_VANTAGE_MAX_RETRIES = int(os.getenv('ALPHA_VANTAGE_MAX_RETRIES', default=2))
+    ALPHA_VANTAGE_BACKOFF_FACTOR = float(os.getenv('ALPHA_VANTAGE_BACKOFF_FACTOR', default=0.5))
+
+    # Alpha Vantage rate limits, shared by the web and worker processes through the database
+    # ('sqlite' only shares them between the workers of a host)
+    ALPHA_VANTAGE_CALLS_PER_MINUTE = int(os.getenv('ALPHA_VANTAGE_CALLS_PER_MINUTE', default=5))
+    ALPHA_VANTAGE_CALLS_PER_DAY = int(os.getenv('ALPHA_VANTAGE_CALLS_PER_DAY', default=500))
+    ALPHA_VANTAGE_RATE_LIMIT_BACKEND = os.getenv('ALPHA_VANTAGE_RATE_LIMIT_BACKEND', default='database')
+    ALPHA_VANTAGE_RATE_LIMIT_PATH = os.getenv('ALPHA_VANTAGE_RATE_LIMIT_PATH', default='instance/rate_limit.sqlite')
+    ALPHA_VANTAGE_BACKGROUND_RESERVE = int(os.getenv('ALPHA_VANTAGE_BACKGROUND_RESERVE', default=1))
+    ALPHA_VANTAGE_INTERACTIVE_WAIT = float(os.getenv('ALPHA_VANTAGE_INTERACTIVE_WAIT', default=5))
+    ALPHA_VANTAGE_BACKGROUND_WAIT = float(os.getenv('ALPHA_VANTAGE_BACKGROUND_WAIT', default=120))
+
+    # Fail fast while Alpha Vantage is down, and back off from the failing symbols
+    ALPHA_VANTAGE_BREAKER_FAILURES = int(os.getenv('ALPHA_VANTAGE_BREAKER_FAILURES', default=5))
+    ALPHA_VANTAGE_BREAKER_RESET = float(os.getenv('ALPHA_VANTAGE_BREAKER_RESET', default=60))
+    ALPHA_VANTAGE_SYMBOL_BACKOFF = float(os.getenv('ALPHA_VANTAGE_SYMBOL_BACKOFF', default=60))
+    ALPHA_VANTAGE_SYMBOL_BACKOFF_MAX = float(os.getenv('ALPHA_VANTAGE_SYMBOL_BACKOFF_MAX', default=86400))
+
+    # Stock quote cache ('memory' is per worker, 'sqlite' is shared by all the workers on the host)
+    QUOTE_CACHE_BACKEND = os.getenv('QUOTE_CACHE_BACKEND', default='memory')
+    QUOTE_CACHE_TTL = int(os.getenv('QUOTE_CACHE_TTL', default=3600))
+    QUOTE_CACHE_MAX_ENTRIES = int(os.getenv('QUOTE_CACHE_MAX_ENTRIES', default=4096))
+    QUOTE_CACHE_PATH = os.getenv('QUOTE_CACHE_PATH', default='instance/quote_cache.sqlite')
+
+    # Directory of the lock files coordinating the quote fetches across the workers
+    # (set it together with the 'sqlite' quote cache; unset to only coalesce within a worker)
+    QUOTE_FLIGHT_LOCK_DIR = os.getenv('QUOTE_FLIGHT_LOCK_DIR', default=None)
+
+    # Cache of the logged-in users, saving a query of the users table on every request
+    # ('memory' per worker, 'sqlite' shared by the workers on the host, or 'null')
+    USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND', default='memory')
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', default=300))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', default=4096))
+    USER_CACHE_PATH = os.getenv('USER_CACHE_PATH', default='instance/user_cache.sqlite')
+
+    # Maximum number of symbols fetched concurrently when refreshing a portfolio
+    PRICE_REFRESH_MAX_WORKERS = int(os.getenv('PRICE_REFRESH_MAX_WORKERS', default=8))
+
+    # Days before the stored weekly price history is updated from Alpha Vantage
+    PRICE_HISTORY_REFRESH_DAYS = int(os.getenv('PRICE_HISTORY_REFRESH_DAYS', default=7))
+
+    # The prices are refreshed by 'flask stocks refresh-prices --loop' (see Procfile);
+    # set to fetch the stale prices while rendering the portfolio page instead
+    PRICE_REFRESH_ON_VIEW = os.getenv('PRICE_REFRESH_ON_VIEW', default='false').lower() in ('1', 'true', 'yes')
+
+    # Stale-while-revalidate: render the stale prices right away and refresh them in a
+    # background thread, unless they are older than PRICE_MAX_STALENESS seconds
+    PRICE_STALE_WHILE_REVALIDATE = os.getenv('PRICE_STALE_WHILE_REVALIDATE', default='false').lower() in ('1', 'true', 'yes')
+    PRICE_MAX_STALENESS = int(os.getenv('PRICE_MAX_STALENESS', default=3 * 24 * 60 * 60))
+
+    # Number of stocks per page of the portfolio page (0 to list all the stocks on one page)
+    STOCKS_PER_PAGE = int(os.getenv('STOCKS_PER_PAGE', default=100))
+
+    # Stream the portfolio page while the stocks are read from the database,
+    # STOCKS_STREAM_BUFFER stocks at a time
+    STOCKS_STREAM_RENDERING = os.getenv('STOCKS_STREAM_RENDERING', default='false').lower() in ('1', 'true', 'yes')
+    STOCKS_STREAM_BUFFER = int(os.getenv('STOCKS_STREAM_BUFFER', default=100))
+
+    # Maximum number of points of the chart of a stock (the weekly prices are downsampled to it)
+    STOCK_CHART_MAX_POINTS = int(os.getenv('STOCK_CHART_MAX_POINTS', default=500))
+
+    # Weak ETags on the portfolio and stock pages, so the browsers revalidating
+    # an unchanged page get a 304 response (without querying the stocks or rendering the page)
+    CONDITIONAL_GET = os.getenv('CONDITIONAL_GET', default='true').lower() in ('1', 'true', 'yes')
+
+    # Directory of the compiled templates, shared by the workers (unset to compile them in each worker),
+    # and whether each worker compiles every template when it starts (see 'flask precompile-templates')
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', default=None)
+    TEMPLATE_PRECOMPILE = os.getenv('TEMPLATE_PRECOMPILE', default='false').lower() in ('1', 'true', 'yes')
+
+    # Serve the fingerprinted static files written by 'flask build-static' (if built),
+    # cached by the browsers for a year
+    STATIC_FINGERPRINTING = os.getenv('STATIC_FINGERPRINTING', default='true').lower() in ('1', 'true', 'yes')
+
+    # Compression of the HTML and JSON responses (brotli if installed, or gzip) larger than
+    # COMPRESSION_MIN_SIZE bytes; set when no proxy in front of the app compresses them
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', default='false').lower() in ('1', 'true', 'yes')
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', default=500))
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', default=6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', default=4))
+    COMPRESSION_MIMETYPES = os.getenv('COMPRESSION_MIMETYPES', default='text/html,application/json').split(',')
+
     LOG_TO_STDOUT = os.getenv('LOG_TO_STDOUT', default=False)
 
 
@@ -41,4 +170,11 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
-    WTF_CSRF_ENABLED = False
\ No newline at end of file
+    WTF_CSRF_ENABLED = False
+    QUOTE_CACHE_BACKEND = 'null'
+    USER_CACHE_BACKEND = 'null'
+    ALPHA_VANTAGE_CALLS_PER_MINUTE = 0
+    ALPHA_VANTAGE_CALLS_PER_DAY = 0
+    ALPHA_VANTAGE_RATE_LIMIT_BACKEND = 'memory'
+    ALPHA_VANTAGE_BREAKER_FAILURES = 0
+    ALPHA_VANTAGE_SYMBOL_BACKOFF = 0
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""added indexes to the stocks table
+
+Revision ID: b7e2d4f91c08
+Revises: a3f1c9d27b64
+Create Date: 2026-10-18 14:03:27.204611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4f91c08'
+down_revision = 'a3f1c9d27b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # portfolio list: WHERE user_id = ? ORDER BY id
+    op.create_index('ix_stocks_user_id_id', 'stocks', ['user_id', 'id'], unique=False)
+    # price refreshes: WHERE upper(stock_symbol) = ?
+    op.create_index('ix_stocks_upper_stock_symbol', 'stocks', [sa.text('upper(stock_symbol)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stocks_upper_stock_symbol', table_name='stocks')
+    op.drop_index('ix_stocks_user_id_id', table_name='stocks')
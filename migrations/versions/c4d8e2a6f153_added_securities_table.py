@@ -0,0 +1,72 @@
+"""added securities table holding the current price of each symbol
+
+Revision ID: c4d8e2a6f153
+Revises: b7e2d4f91c08
+Create Date: 2026-10-18 16:45:12.884301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2a6f153'
+down_revision = 'b7e2d4f91c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('securities',
+    sa.Column('symbol', sa.String(), nullable=False),
+    sa.Column('current_price', sa.Float(), nullable=True),
+    sa.Column('current_price_date', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('symbol')
+    )
+
+    # One security per symbol, with the most recent price of the lots holding it
+    op.execute('INSERT INTO securities (symbol) SELECT DISTINCT upper(stock_symbol) FROM stocks')
+    op.execute('UPDATE securities SET '
+               'current_price = (SELECT stocks.current_price FROM stocks '
+               '                 WHERE upper(stocks.stock_symbol) = securities.symbol '
+               '                 AND stocks.current_price_date IS NOT NULL '
+               '                 ORDER BY stocks.current_price_date DESC LIMIT 1), '
+               'current_price_date = (SELECT max(stocks.current_price_date) FROM stocks '
+               '                      WHERE upper(stocks.stock_symbol) = securities.symbol)')
+    op.execute('UPDATE securities SET current_price = 0 WHERE current_price IS NULL')
+
+    op.add_column('stocks', sa.Column('security_symbol', sa.String(), nullable=True))
+    op.execute('UPDATE stocks SET security_symbol = upper(stock_symbol)')
+
+    # The prices are no longer looked up by upper(stock_symbol)
+    op.drop_index('ix_stocks_upper_stock_symbol', table_name='stocks')
+
+    with op.batch_alter_table('stocks') as batch_op:
+        batch_op.alter_column('security_symbol', existing_type=sa.String(), nullable=False)
+        batch_op.create_foreign_key('fk_stocks_security_symbol_securities', 'securities', ['security_symbol'], ['symbol'])
+        batch_op.create_index('ix_stocks_security_symbol', ['security_symbol'], unique=False)
+        batch_op.drop_column('position_value')
+        batch_op.drop_column('current_price_date')
+        batch_op.drop_column('current_price')
+
+
+def downgrade():
+    with op.batch_alter_table('stocks') as batch_op:
+        batch_op.add_column(sa.Column('current_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('current_price_date', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('position_value', sa.Float(), nullable=True))
+
+    op.execute('UPDATE stocks SET '
+               'current_price = (SELECT securities.current_price FROM securities '
+               '                 WHERE securities.symbol = stocks.security_symbol), '
+               'current_price_date = (SELECT securities.current_price_date FROM securities '
+               '                      WHERE securities.symbol = stocks.security_symbol)')
+    op.execute('UPDATE stocks SET position_value = coalesce(current_price, 0) * number_of_shares')
+
+    with op.batch_alter_table('stocks') as batch_op:
+        batch_op.drop_index('ix_stocks_security_symbol')
+        batch_op.drop_constraint('fk_stocks_security_symbol_securities', type_='foreignkey')
+        batch_op.drop_column('security_symbol')
+
+    op.create_index('ix_stocks_upper_stock_symbol', 'stocks', [sa.text('upper(stock_symbol)')], unique=False)
+    op.drop_table('securities')
@@ -0,0 +1,42 @@
+"""added portfolio_summary table holding the totals of the portfolio of each user
+
+Revision ID: d9a1f7b3c2e5
+Revises: c4d8e2a6f153
+Create Date: 2026-10-18 18:02:37.415920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a1f7b3c2e5'
+down_revision = 'c4d8e2a6f153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('portfolio_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.Column('cost_basis', sa.Float(), nullable=False),
+    sa.Column('lot_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # The summary of every user holding stocks (the summaries are then maintained incrementally)
+    op.execute('INSERT INTO portfolio_summary (user_id, total_value, cost_basis, lot_count, updated_at) '
+               'SELECT stocks.user_id, '
+               '       coalesce(sum(coalesce(securities.current_price, 0) * stocks.number_of_shares), 0), '
+               '       coalesce(sum(stocks.purchase_price * stocks.number_of_shares), 0), '
+               '       count(stocks.id), CURRENT_TIMESTAMP '
+               'FROM stocks JOIN securities ON stocks.security_symbol = securities.symbol '
+               'WHERE stocks.user_id IS NOT NULL '
+               'GROUP BY stocks.user_id')
+
+
+def downgrade():
+    op.drop_table('portfolio_summary')
@@ -0,0 +1,29 @@
+"""added token_buckets table holding the state of the Alpha Vantage rate limiter
+
+Revision ID: e5b2c8a4d7f1
+Revises: d9a1f7b3c2e5
+Create Date: 2026-10-18 21:14:52.603318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2c8a4d7f1'
+down_revision = 'd9a1f7b3c2e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('token_buckets',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('token_buckets')
@@ -7,16 +7,24 @@ from logging.handlers import RotatingFileHandler
 
 
 from flask.logging import default_handler
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate, migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
 from flask_mail import Mail
 
+from project.alpha_vantage import AlphaVantageClient
+from project.cache import QuoteCache, UserCache
+from project.compression import configure_compression
+from project.db_routing import RoutingSQLAlchemy
+from project.pool_metrics import configure_pool_metrics
+from project.single_flight import SingleFlight
+from project.static_assets import configure_static_assets
+from project.template_cache import configure_template_cache
 
 
-# db config
-db = SQLAlchemy()
+
+# db config (the read-only queries can go to a read replica, see project.db_routing)
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 csrf_protection = CSRFProtect()
 
@@ -27,6 +35,18 @@ login.login_view = "users.login"
 # mail config
 mail = Mail()
 
+# stock quote cache config
+quote_cache = QuoteCache()
+
+# logged-in user cache config
+user_cache = UserCache()
+
+# coalesces the concurrent fetches of the same stock quote
+quote_flights = SingleFlight()
+
+# Alpha Vantage API client (pooled, keep-alive connections)
+alpha_vantage = AlphaVantageClient()
+
 def create_app():
     app = Flask(__name__)
 
@@ -40,6 +60,10 @@ def create_app():
     configure_logging(app)
     register_app_callbacks(app)
     register_error_pages(app)
+    # After the blueprints are registered, so their templates are precompiled too
+    configure_template_cache(app)
+    configure_static_assets(app)
+    configure_compression(app)
     return app
 
 def register_blueprints(app):
@@ -104,6 +128,7 @@ def register_error_pages(app):
         return render_template('405.html'), 405
 
 def init_ext(app):
+    configure_pool_metrics(app)
     db.init_app(app)
     migrate.init_app(app, db)
     csrf_protection.init_app(app)
@@ -114,7 +139,10 @@ def init_ext(app):
 
     @login.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return User.load(int(user_id))
 
     mail.init_app(app)
+    quote_cache.init_app(app)
+    user_cache.init_app(app)
+    alpha_vantage.init_app(app)
 
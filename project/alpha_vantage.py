@@ -0,0 +1,373 @@
+"""
+HTTP client for the Alpha Vantage API.
+
+All the calls to Alpha Vantage go through a single requests.Session per worker
+process, so the TCP+TLS connections are kept alive and re-used between calls.
+The session is configured with a connection pool, connect/read timeouts and
+retries of the failed connections; the calls failing on the server side are
+retried with an exponential backoff, each retry taking its own token.
+
+Every call also takes a token from the rate limiter first (see rate_limit.py),
+with interactive page fetches served ahead of background refreshes, and no call
+is made while the circuit breaker is open (see circuit_breaker.py).
+
+iter_time_series() parses a time series response while it is downloaded, so
+the callers can stop as soon as they have the dates they need.
+"""
+import codecs
+import json
+import os
+import threading
+import time
+
+import requests
+from flask import current_app, has_request_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from project.circuit_breaker import CircuitBreaker, SymbolBackoff
+from project.rate_limit import (BACKGROUND, INTERACTIVE, DatabaseBucketStore, MemoryBucketStore, PriorityScheduler,
+                                RateLimiter, SQLiteBucketStore)
+
+
+# Failures of a call retried by AlphaVantageClient.get() (the connection errors are retried by urllib3)
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+RETRY_EXCEPTIONS = (requests.exceptions.ReadTimeout, requests.exceptions.ChunkedEncodingError)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no API call is available within the allowed wait time."""
+
+
+class CircuitOpen(Exception):
+    """Raised when no API call is made because Alpha Vantage is failing."""
+
+
+class MissingTimeSeries(Exception):
+    """
+    Raised when a response does not contain the expected time series.
+
+    payload is the decoded response (e.g. {'Note': ...} when the API rate limit
+    has been exceeded), or an empty dict if it is not valid JSON.
+    """
+
+    def __init__(self, key: str, payload: dict):
+        super().__init__(f'Could not find the {key} key')
+        self.payload = payload
+
+
+class _JSONTextStream(object):
+    """Incrementally decoded JSON text, read from an iterable of byte chunks."""
+
+    # Text kept to decode the payload of a response without the time series
+    MAX_KEPT_TEXT = 65536
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.kept_text = ''
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer; returns False at the end of the stream."""
+        for chunk in self._chunks:
+            if chunk:
+                text = self._decoder.decode(chunk)
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def skip_whitespace(self):
+        """Return the next non-whitespace character (without consuming it), or None at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, char: str):
+        if self.skip_whitespace() != char:
+            raise ValueError(f'Expected {char!r} in the JSON response')
+        self.pos += 1
+
+    def find(self, text: str) -> bool:
+        """Move past the next occurrence of text; returns False if it is not found."""
+        while True:
+            index = self.buffer.find(text, self.pos)
+            if index >= 0:
+                self.pos = index + len(text)
+                return True
+
+            # Keep the end of the buffer, in case text is split across two chunks
+            keep_from = max(len(self.buffer) - len(text) + 1, self.pos)
+            if len(self.kept_text) < self.MAX_KEPT_TEXT:
+                self.kept_text += self.buffer[self.pos:keep_from]
+            self.pos = keep_from
+
+            if not self.fill():
+                self.kept_text += self.buffer[self.pos:]
+                self.pos = len(self.buffer)
+                return False
+
+    def decode_value(self):
+        """Decode the next complete JSON value (a string or an object)."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, self.pos = self._json_decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+
+def iter_time_series(chunks, key: str):
+    """
+    Yield the (date, fields) pairs of a time series response, in the order they are received.
+
+    chunks is an iterable of bytes (e.g. response.iter_content()) and key is the name of
+    the time series (e.g. 'Time Series (Daily)').  Alpha Vantage sends the latest date
+    first, so the caller can stop iterating once it has the dates it needs, without
+    parsing (or keeping in memory) the rest of the response.
+
+    Raises MissingTimeSeries if the response does not contain the time series,
+    and ValueError if the response is not valid JSON.
+    """
+    stream = _JSONTextStream(chunks)
+
+    if not stream.find(json.dumps(key)):
+        try:
+            payload = json.loads(stream.kept_text)
+        except ValueError:
+            payload = {}
+        raise MissingTimeSeries(key, payload if isinstance(payload, dict) else {})
+
+    stream.expect(':')
+    stream.expect('{')
+    while True:
+        char = stream.skip_whitespace()
+        if char == '}':
+            return
+        if char is None:
+            raise ValueError('Unexpected end of the JSON response')
+        if char == ',':
+            stream.pos += 1
+            continue
+
+        date = stream.decode_value()
+        stream.expect(':')
+        fields = stream.decode_value()
+        yield date, fields
+
+
+class AlphaVantageClient(object):
+    """
+    Flask extension wrapping a pooled, keep-alive requests.Session.
+
+    Configuration:
+        ALPHA_VANTAGE_POOL_SIZE - maximum number of connections kept alive (default: 10)
+        ALPHA_VANTAGE_CONNECT_TIMEOUT - seconds to wait for the connection (default: 3.05)
+        ALPHA_VANTAGE_READ_TIMEOUT - seconds to wait for the response (default: 10)
+        ALPHA_VANTAGE_MAX_RETRIES - retries on connection errors, read timeouts and 5xx responses (default: 2)
+        ALPHA_VANTAGE_BACKOFF_FACTOR - backoff between retries (0.5 => 0.5s, 1s, 2s, ...)
+        ALPHA_VANTAGE_CALLS_PER_MINUTE - API calls allowed per minute (0 to disable the limit)
+        ALPHA_VANTAGE_CALLS_PER_DAY - API calls allowed per day (0 to disable the limit)
+        ALPHA_VANTAGE_RATE_LIMIT_BACKEND - 'database' (shared by the web and worker processes of every host),
+                                           'sqlite' (shared by the workers of a host) or 'memory'
+        ALPHA_VANTAGE_RATE_LIMIT_PATH - SQLite file used by the 'sqlite' backend
+        ALPHA_VANTAGE_BACKGROUND_RESERVE - tokens that background calls leave for interactive calls
+        ALPHA_VANTAGE_INTERACTIVE_WAIT - seconds an interactive call may wait for a token
+        ALPHA_VANTAGE_BACKGROUND_WAIT - seconds a background call may wait for a token
+        ALPHA_VANTAGE_BREAKER_FAILURES - consecutive failures opening the circuit breaker (0 to disable it)
+        ALPHA_VANTAGE_BREAKER_RESET - seconds before a trial call is made once the breaker is open
+        ALPHA_VANTAGE_SYMBOL_BACKOFF - seconds a failing symbol is not requested (0 to disable it),
+                                       doubled after each new failure
+        ALPHA_VANTAGE_SYMBOL_BACKOFF_MAX - maximum seconds a failing symbol is not requested
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._session = None
+        self._scheduler = None
+        self._breaker = None
+        self._symbol_backoff = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALPHA_VANTAGE_POOL_SIZE', 10)
+        app.config.setdefault('ALPHA_VANTAGE_CONNECT_TIMEOUT', 3.05)
+        app.config.setdefault('ALPHA_VANTAGE_READ_TIMEOUT', 10)
+        app.config.setdefault('ALPHA_VANTAGE_MAX_RETRIES', 2)
+        app.config.setdefault('ALPHA_VANTAGE_BACKOFF_FACTOR', 0.5)
+        app.config.setdefault('ALPHA_VANTAGE_CALLS_PER_MINUTE', 5)
+        app.config.setdefault('ALPHA_VANTAGE_CALLS_PER_DAY', 500)
+        app.config.setdefault('ALPHA_VANTAGE_RATE_LIMIT_BACKEND', 'database')
+        app.config.setdefault('ALPHA_VANTAGE_RATE_LIMIT_PATH', os.path.join(app.instance_path, 'rate_limit.sqlite'))
+        app.config.setdefault('ALPHA_VANTAGE_BACKGROUND_RESERVE', 1)
+        app.config.setdefault('ALPHA_VANTAGE_INTERACTIVE_WAIT', 5)
+        app.config.setdefault('ALPHA_VANTAGE_BACKGROUND_WAIT', 120)
+        app.config.setdefault('ALPHA_VANTAGE_BREAKER_FAILURES', 5)
+        app.config.setdefault('ALPHA_VANTAGE_BREAKER_RESET', 60)
+        app.config.setdefault('ALPHA_VANTAGE_SYMBOL_BACKOFF', 60)
+        app.config.setdefault('ALPHA_VANTAGE_SYMBOL_BACKOFF_MAX', 86400)
+        app.extensions['alpha_vantage'] = self
+
+    @staticmethod
+    def create_session(pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+        # Only the failed connections are retried by urllib3: no call reaches Alpha Vantage, so no
+        # token is spent.  The calls failing on the server side are retried by get(), each retry
+        # taking a token from the rate limiter.
+        retry = Retry(total=max_retries,
+                      connect=max_retries,
+                      read=0,
+                      status=0,
+                      allowed_methods=frozenset(['GET']),
+                      backoff_factor=backoff_factor,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @staticmethod
+    def create_scheduler(config) -> PriorityScheduler:
+        if config['ALPHA_VANTAGE_RATE_LIMIT_BACKEND'] == 'database':
+            from project import db
+            from project.models import TokenBucket
+            store = DatabaseBucketStore(db.engine, TokenBucket.__table__)
+        elif config['ALPHA_VANTAGE_RATE_LIMIT_BACKEND'] == 'sqlite':
+            store = SQLiteBucketStore(config['ALPHA_VANTAGE_RATE_LIMIT_PATH'])
+        else:
+            store = MemoryBucketStore()
+
+        limiter = RateLimiter([(config['ALPHA_VANTAGE_CALLS_PER_MINUTE'], 60),
+                               (config['ALPHA_VANTAGE_CALLS_PER_DAY'], 86400)], store)
+        return PriorityScheduler(limiter, background_reserve=config['ALPHA_VANTAGE_BACKGROUND_RESERVE'])
+
+    def _setup(self):
+        # One session per worker process: pooled connections must not be shared across a fork()
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self.create_session(current_app.config['ALPHA_VANTAGE_POOL_SIZE'],
+                                                        current_app.config['ALPHA_VANTAGE_MAX_RETRIES'],
+                                                        current_app.config['ALPHA_VANTAGE_BACKOFF_FACTOR'])
+                    self._scheduler = self.create_scheduler(current_app.config)
+                    self._breaker = CircuitBreaker(current_app.config['ALPHA_VANTAGE_BREAKER_FAILURES'],
+                                                   current_app.config['ALPHA_VANTAGE_BREAKER_RESET'])
+                    self._symbol_backoff = SymbolBackoff(current_app.config['ALPHA_VANTAGE_SYMBOL_BACKOFF'],
+                                                         current_app.config['ALPHA_VANTAGE_SYMBOL_BACKOFF_MAX'])
+                    self._pid = os.getpid()
+
+    @property
+    def session(self) -> requests.Session:
+        self._setup()
+        return self._session
+
+    @property
+    def scheduler(self) -> PriorityScheduler:
+        self._setup()
+        return self._scheduler
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        self._setup()
+        return self._breaker
+
+    @property
+    def symbol_backoff(self) -> SymbolBackoff:
+        self._setup()
+        return self._symbol_backoff
+
+    @staticmethod
+    def default_priority() -> int:
+        """Calls made while handling a request are interactive, all the others are background calls."""
+        return INTERACTIVE if has_request_context() else BACKGROUND
+
+    def get(self, url: str, priority: int = None, **kwargs) -> requests.Response:
+        """
+        Send a GET request to Alpha Vantage using the pooled session.
+
+        A call timing out while reading the response or failing with a 5xx
+        response is retried (up to ALPHA_VANTAGE_MAX_RETRIES times, with an
+        exponential backoff), each retry taking a token from the rate limiter.
+        A 429 response is not retried: the limiter is drained instead.
+
+        Raises CircuitOpen while Alpha Vantage is failing, RateLimitExceeded if
+        no call is available within the allowed wait time, and
+        requests.exceptions.RequestException (ConnectionError, Timeout, ...)
+        if the call fails once all the retries are used.
+        """
+        if priority is None:
+            priority = self.default_priority()
+
+        kwargs.setdefault('timeout', (current_app.config['ALPHA_VANTAGE_CONNECT_TIMEOUT'],
+                                      current_app.config['ALPHA_VANTAGE_READ_TIMEOUT']))
+        max_retries = current_app.config['ALPHA_VANTAGE_MAX_RETRIES']
+        for attempt in range(max_retries + 1):
+            if attempt > 0:
+                time.sleep(current_app.config['ALPHA_VANTAGE_BACKOFF_FACTOR'] * 2 ** (attempt - 1))
+
+            try:
+                r = self._get_once(url, priority, **kwargs)
+            except RETRY_EXCEPTIONS:
+                if attempt == max_retries:
+                    raise
+                continue
+
+            if r.status_code == 429:
+                self.report_throttled()
+            elif r.status_code in RETRY_STATUSES and attempt < max_retries:
+                r.close()
+                continue
+            return r
+
+    def _get_once(self, url: str, priority: int, **kwargs) -> requests.Response:
+        """Make a single call to Alpha Vantage, once the circuit breaker and the rate limiter allow it."""
+        if not self.breaker.allow():
+            raise CircuitOpen('Alpha Vantage is failing, no call is made until the circuit breaker resets')
+
+        if priority == INTERACTIVE:
+            wait = current_app.config['ALPHA_VANTAGE_INTERACTIVE_WAIT']
+        else:
+            wait = current_app.config['ALPHA_VANTAGE_BACKGROUND_WAIT']
+
+        if not self.scheduler.acquire(priority, timeout=wait):
+            self.breaker.cancel()
+            raise RateLimitExceeded(f'No Alpha Vantage API call available within {wait} seconds')
+
+        try:
+            r = self.session.get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        # Server errors mean that Alpha Vantage is failing (client errors are specific to the call)
+        if r.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return r
+
+    def report_throttled(self):
+        """Stop spending calls for a while after Alpha Vantage reports that the calls are throttled."""
+        self.scheduler.limiter.drain()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._scheduler = None
+            self._breaker = None
+            self._symbol_backoff = None
+            self._pid = None
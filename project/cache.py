@@ -0,0 +1,281 @@
+"""
+Small key/value caches with a time-to-live (TTL) and least-recently-used (LRU) eviction.
+
+Two backends are available:
+    * MemoryCache - per-process cache (each gunicorn worker has its own copy)
+    * SQLiteCache - cache stored in a SQLite file, so every worker on the host shares the entries
+
+The QuoteCache extension puts one of these backends in front of the Alpha Vantage API,
+keyed by stock symbol, so the same close price is only fetched once per TTL.
+
+The UserCache extension keeps the column values of the logged-in users, keyed by
+user id, so Flask-Login does not query the users table on every request.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from project.sqlite import SQLiteConnections
+
+
+class MemoryCache(object):
+    """In-process cache with TTL expiry and LRU eviction (thread-safe)."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, timer=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= self._timer():
+                del self._entries[key]
+                return None
+
+            # Mark the entry as the most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            # Evict the least recently used entries
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(object):
+    """
+    Cache stored in a SQLite file, shared by all the processes on the host.
+
+    Values are pickled, so any picklable object can be cached.  Each thread
+    (and each forked process) opens its own connection to the file.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, max_entries: int = 1024, timer=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._timer = timer
+        self._connections = SQLiteConnections(path, synchronous='NORMAL')
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                         'key TEXT PRIMARY KEY, '
+                         'value BLOB NOT NULL, '
+                         'expires_at REAL NOT NULL, '
+                         'last_access REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access '
+                         'ON cache_entries (last_access)')
+
+    def _connect(self):
+        return self._connections.get()
+
+    def get(self, key):
+        now = self._timer()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, expires_at = row
+        if expires_at <= now:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?', (key, now))
+            return None
+
+        conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl: float = None):
+        now = self._timer()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at, last_access) '
+                     'VALUES (?, ?, ?, ?)', (key, pickle.dumps(value), expires_at, now))
+
+        # Evict the expired entries first, then the least recently used ones
+        conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM cache_entries WHERE key IN ('
+                     'SELECT key FROM cache_entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                     (self.max_entries,))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entries')
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+class NullCache(object):
+    """Cache that never stores anything (used to disable caching)."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl: float = None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+def create_cache(backend: str, ttl: float, max_entries: int, path: str = None):
+    """Create a cache for the backend name ('memory', 'sqlite' or 'null')."""
+    if backend == 'memory':
+        return MemoryCache(ttl=ttl, max_entries=max_entries)
+    if backend == 'sqlite':
+        return SQLiteCache(path, ttl=ttl, max_entries=max_entries)
+    if backend in (None, '', 'null'):
+        return NullCache()
+    raise ValueError(f'Unknown cache backend: {backend}')
+
+
+def seconds_until_midnight() -> float:
+    """Return the number of seconds before the end of the current day (local time)."""
+    now = datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+
+class KeyedCache(object):
+    """
+    Base class of the Flask extensions caching values by key in one of the backends above.
+
+    A subclass names its extension (name is also the prefix of its configuration,
+    e.g. 'quote_cache' for QUOTE_CACHE_BACKEND), and sets how the keys are
+    written (_key()) and how long an entry stays valid (_ttl()).
+
+    The backend is created on first use, so the configuration can still be
+    changed after init_app() (as the test suite does).
+    """
+
+    name = None
+    default_ttl = 3600
+    default_max_entries = 4096
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        prefix = self.name.upper()
+        app.config.setdefault(f'{prefix}_BACKEND', 'memory')
+        app.config.setdefault(f'{prefix}_TTL', self.default_ttl)
+        app.config.setdefault(f'{prefix}_MAX_ENTRIES', self.default_max_entries)
+        app.config.setdefault(f'{prefix}_PATH', os.path.join(app.instance_path, f'{self.name}.sqlite'))
+        app.extensions[self.name] = None
+
+    @property
+    def backend(self):
+        app = current_app._get_current_object()
+        cache = app.extensions.get(self.name)
+        if cache is None:
+            prefix = self.name.upper()
+            cache = create_cache(app.config[f'{prefix}_BACKEND'],
+                                 ttl=app.config[f'{prefix}_TTL'],
+                                 max_entries=app.config[f'{prefix}_MAX_ENTRIES'],
+                                 path=app.config[f'{prefix}_PATH'])
+            app.extensions[self.name] = cache
+        return cache
+
+    def _key(self, key) -> str:
+        return str(key)
+
+    def _ttl(self):
+        # None for the TTL of the backend
+        return None
+
+    def get(self, key):
+        """Return the cached value, or None if missing/expired."""
+        return self.backend.get(self._key(key))
+
+    def set(self, key, value):
+        self.backend.set(self._key(key), value, ttl=self._ttl())
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    def clear(self):
+        self.backend.clear()
+
+
+class QuoteCache(KeyedCache):
+    """
+    Flask extension caching the latest close price of each stock symbol.
+
+    Configuration:
+        QUOTE_CACHE_BACKEND - 'memory', 'sqlite' or 'null' (default: 'memory')
+        QUOTE_CACHE_TTL - number of seconds an entry stays valid, at most until midnight (default: 3600)
+        QUOTE_CACHE_MAX_ENTRIES - maximum number of symbols kept (default: 4096)
+        QUOTE_CACHE_PATH - SQLite file used by the 'sqlite' backend
+        QUOTE_FLIGHT_LOCK_DIR - lock files directory used to fetch each symbol once across processes
+    """
+
+    name = 'quote_cache'
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('QUOTE_FLIGHT_LOCK_DIR', None)
+
+    def _key(self, symbol: str) -> str:
+        return symbol.strip().upper()
+
+    def _ttl(self):
+        # The prices are dated when they are stored (see Stock.set_current_price()), so a price
+        # cached on one day must not be served on the next one, where it would look up to date
+        return min(current_app.config['QUOTE_CACHE_TTL'], seconds_until_midnight())
+
+
+class UserCache(KeyedCache):
+    """
+    Flask extension caching the column values ({name: value}) of the users loaded by Flask-Login.
+
+    Configuration:
+        USER_CACHE_BACKEND - 'memory', 'sqlite' or 'null' (default: 'memory')
+        USER_CACHE_TTL - number of seconds an entry stays valid (default: 300)
+        USER_CACHE_MAX_ENTRIES - maximum number of users kept (default: 4096)
+        USER_CACHE_PATH - SQLite file used by the 'sqlite' backend
+
+    The entries are deleted when a user is updated (see project.models), so the
+    TTL only bounds how long a change made by another process can go unseen.
+    """
+
+    name = 'user_cache'
+    default_ttl = 300
+
+    def _key(self, user_id: int) -> str:
+        return f'user:{int(user_id)}'
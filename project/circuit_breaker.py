@@ -0,0 +1,108 @@
+"""
+Failure handling for the calls to the Alpha Vantage API.
+
+CircuitBreaker fails fast while the API is down: after a number of consecutive
+failures (network errors, 5xx responses) no call is made until the reset
+timeout is over, then a single trial call decides whether to close it again.
+
+SymbolBackoff is a negative cache of the symbols that failed (e.g. invalid
+symbols): a failing symbol is not requested again until its backoff is over,
+and the backoff doubles after each new failure.
+"""
+import threading
+import time
+
+from project.cache import MemoryCache
+
+
+class CircuitBreaker(object):
+    """Per-process circuit breaker (thread-safe); a failure_threshold of 0 disables it."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60, timer=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._timer = timer
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a call can be made now."""
+        if self.failure_threshold <= 0:
+            return True
+
+        with self._lock:
+            if self.state == self.OPEN and self._timer() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # Only a single trial call while half-open
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+                return True
+
+            return self.state == self.CLOSED
+
+    def cancel(self):
+        """The call allowed by allow() was not made after all."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._timer()
+
+
+class SymbolBackoff(object):
+    """Negative cache of the failing symbols with an exponential backoff; a base_delay of 0 disables it."""
+
+    def __init__(self, base_delay: float = 60, max_delay: float = 86400, max_entries: int = 4096, timer=time.time):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._timer = timer
+        self._failures = MemoryCache(ttl=max(max_delay, base_delay) * 2, max_entries=max_entries, timer=timer)
+
+    def remaining(self, symbol: str) -> float:
+        """Return the number of seconds before the symbol can be requested again (0 if it can be now)."""
+        entry = self._failures.get(symbol.strip().upper())
+        if entry is None:
+            return 0.0
+        return max(entry[1] - self._timer(), 0.0)
+
+    def is_blocked(self, symbol: str) -> bool:
+        return self.remaining(symbol) > 0.0
+
+    def record_failure(self, symbol: str) -> float:
+        """Block the symbol for a delay doubling with each consecutive failure; returns the delay."""
+        if self.base_delay <= 0:
+            return 0.0
+
+        key = symbol.strip().upper()
+        failures = (self._failures.get(key) or (0, 0.0))[0] + 1
+        delay = min(self.base_delay * 2 ** (failures - 1), self.max_delay)
+        self._failures.set(key, (failures, self._timer() + delay))
+        return delay
+
+    def record_success(self, symbol: str):
+        self._failures.delete(symbol.strip().upper())
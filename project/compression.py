@@ -0,0 +1,112 @@
+"""
+Compression of the responses (opt-in with COMPRESSION_ENABLED).
+
+The responses whose mimetype is in COMPRESSION_MIMETYPES are compressed with
+brotli (if the brotli package is installed) or gzip, as accepted by the
+browser.  The responses smaller than COMPRESSION_MIN_SIZE bytes are sent as
+they are, as compressing them costs more than it saves.
+
+A streamed response (e.g. the portfolio page with STOCKS_STREAM_RENDERING) is
+compressed chunk by chunk, each chunk being flushed, so the browser still
+receives the first rows of the page before the whole page is rendered.
+
+The files sent by send_file() (the static files) are not compressed here:
+the fingerprinted static files are precompressed (see static_assets.py).
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover (optional dependency)
+    brotli = None
+
+# Statuses without a body
+NO_BODY_STATUSES = {204, 304}
+
+
+def configure_compression(app):
+    app.config.setdefault('COMPRESSION_ENABLED', False)
+    app.config.setdefault('COMPRESSION_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESSION_LEVEL', 6)
+    app.config.setdefault('COMPRESSION_BROTLI_QUALITY', 4)
+    app.config.setdefault('COMPRESSION_MIMETYPES', ['text/html', 'application/json'])
+
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        return compress(response, request.accept_encodings, app.config)
+
+
+def select_encoding(accept_encodings):
+    """Return the Content-Encoding to use ('br', 'gzip' or None) given the Accept-Encoding of the request."""
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress(response, accept_encodings, config):
+    """Compress the response (in place) if its mimetype and size are worth it; returns the response."""
+    if (response.status_code < 200 or response.status_code in NO_BODY_STATUSES
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESSION_MIMETYPES']
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    # The response depends on the Accept-Encoding, even when it is not compressed
+    response.vary.add('Accept-Encoding')
+    encoding = select_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESSION_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=config['COMPRESSION_BROTLI_QUALITY']))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=config['COMPRESSION_LEVEL']))
+
+    response.content_encoding = encoding
+    # A strong ETag identifies the bytes sent, so it differs for the compressed response
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def _compress_stream(chunks, encoding, config):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESSION_BROTLI_QUALITY'])
+
+        def compress_chunk(chunk):
+            return compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    else:
+        # wbits=31: gzip header and trailer
+        compressor = zlib.compressobj(config['COMPRESSION_LEVEL'], zlib.DEFLATED, 31)
+
+        def compress_chunk(chunk):
+            return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compress_chunk(chunk)
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
@@ -0,0 +1,47 @@
+"""
+Conditional GET of the pages rendered from the database.
+
+A page sets a weak ETag derived from a version of the data it is rendered
+from (e.g. the portfolio summary of the user).  When the browser revalidates
+its copy with If-None-Match and the version has not changed, not_modified()
+returns a 304 response before the page queries its data and renders its
+template.  The pages showing flashed messages are neither validated nor cached.
+
+The ETag is the only validator: a Last-Modified date has a resolution of a
+second, while the version can change several times within a second.
+
+The responses are private and must be revalidated (Cache-Control: private,
+no-cache), so a change is shown on the next request.
+"""
+import hashlib
+
+from flask import current_app, request, session
+
+
+def make_etag(*version) -> str:
+    """Return the ETag of the version (any values with a stable repr) of a page."""
+    return hashlib.sha1(repr(version).encode()).hexdigest()
+
+
+def conditional_get_enabled() -> bool:
+    """Return True if the page of the current request can be validated by the browser."""
+    if not current_app.config['CONDITIONAL_GET'] or request.method not in ('GET', 'HEAD'):
+        return False
+
+    # The flashed messages are only displayed once, so the page must be rendered (and not cached)
+    return '_flashes' not in session
+
+
+def not_modified(etag: str):
+    """Return a 304 response if the copy of the page held by the browser is current, None otherwise."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return add_validators(current_app.response_class(status=304), etag)
+
+
+def add_validators(response, etag: str):
+    """Set the validator of the page on the response (sent with every response, including the 304s)."""
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,96 @@
+"""
+Routing of the read-only queries to a read replica.
+
+When a 'replica' bind is configured (SQLALCHEMY_BINDS, set from the
+DATABASE_REPLICA_URL environment variable), the queries made by the views
+decorated with @read_only, and inside replica_reads() blocks, are sent to the
+replica.  Everything else goes to the primary database:
+    * the flushes and the INSERT/UPDATE/DELETE statements
+    * every query of a session after it has flushed a change
+    * every query of a user during DATABASE_REPLICA_STICKY_SECONDS after they
+      committed a change (read-your-writes, as the replica may lag behind)
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+from project.pool_metrics import instrument_engine
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    """Session sending the read-only queries to the replica bind, if configured."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._use_replica(clause):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+    def _use_replica(self, clause) -> bool:
+        if not self.info.get('replica_reads') or REPLICA_BIND not in (self.app.config['SQLALCHEMY_BINDS'] or {}):
+            return False
+
+        # The writes, and the reads that must see them, go to the primary
+        if self._flushing or self.info.get('wrote') or isinstance(clause, UpdateBase):
+            return False
+        if self.new or self.dirty or self.deleted:
+            return False
+
+        return not reads_pinned_to_primary()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        # The checkouts of the primary and replica pools are timed (see pool_metrics.py)
+        return instrument_engine(super().create_engine(sa_url, engine_opts))
+
+
+def reads_pinned_to_primary() -> bool:
+    """Return True if the current user committed a change recently (so must read from the primary)."""
+    return has_request_context() and flask_session.get('db_primary_until', 0) > time.time()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_user_to_primary(session):
+    if session.info.get('wrote') and has_request_context() and REPLICA_BIND in (session.app.config['SQLALCHEMY_BINDS'] or {}):
+        flask_session['db_primary_until'] = time.time() + session.app.config['DATABASE_REPLICA_STICKY_SECONDS']
+
+
+def _db_session():
+    return get_state(current_app).db.session
+
+
+@contextmanager
+def replica_reads():
+    """Send the read-only queries made inside the block to the replica."""
+    db_session = _db_session()
+    previous = db_session.info.get('replica_reads', False)
+    db_session.info['replica_reads'] = True
+    try:
+        yield
+    finally:
+        db_session.info['replica_reads'] = previous
+
+
+def read_only(view):
+    """Decorator of the views only reading from the database, so their queries can go to the replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # The session lasts for the whole request, including a streamed response
+        _db_session().info['replica_reads'] = True
+        return view(*args, **kwargs)
+    return wrapper
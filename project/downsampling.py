@@ -0,0 +1,52 @@
+"""
+Downsampling of the price series displayed in the charts.
+
+lttb() implements the Largest-Triangle-Three-Buckets algorithm (Steinarsson,
+2013): the first and last points are kept, the other points are split into
+equal buckets, and the point of each bucket forming the largest triangle
+with the point kept in the previous bucket and the average of the next bucket
+is kept.  Unlike taking every n-th point, it preserves the peaks and troughs
+of the series, so the shape of the chart is unchanged.
+"""
+
+
+def lttb(xs: list, ys: list, threshold: int) -> list:
+    """Return the indexes of (at most) threshold points of the series to keep, in order."""
+    count = len(xs)
+    if threshold >= count or count <= 2:
+        return list(range(count))
+    if threshold < 3:
+        return [0, count - 1][:max(threshold, 0)]
+
+    # The points between the first and the last one are split into threshold - 2 buckets
+    bucket_size = (count - 2) / (threshold - 2)
+    indexes = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket (the last point for the last bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        previous_x, previous_y = xs[previous], ys[previous]
+        largest_area = -1.0
+        selected = start
+        for index in range(start, end):
+            # Twice the area of the triangle (previous point, point, next average)
+            area = abs((previous_x - average_x) * (ys[index] - previous_y) -
+                       (previous_x - xs[index]) * (average_y - previous_y))
+            if area > largest_area:
+                largest_area = area
+                selected = index
+
+        indexes.append(selected)
+        previous = selected
+
+    indexes.append(count - 1)
+    return indexes
@@ -1,10 +1,17 @@
 from flask import current_app
 import requests
 
-from project import db
+from project import db, quote_cache, quote_flights, alpha_vantage, user_cache
+from project.alpha_vantage import CircuitOpen, MissingTimeSeries, RateLimitExceeded, iter_time_series
+from project.db_routing import replica_reads
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached, object_session
 
 # ***daily stock price***
 def create_alpha_vantage_url_daily_compact(symbol: str) -> str:
@@ -18,39 +25,156 @@ def create_alpha_vantage_url_daily_compact(symbol: str) -> str:
 
 
 # ***method to get daily stock data***
-def get_current_stock_price(symbol: str) -> float:
+def get_current_stock_price(symbol: str, priority: int = None) -> float:
     current_price = 0.0
     url = create_alpha_vantage_url_daily_compact(symbol)
 
-    # Attempt the GET call to Alpha Vantage and check that a ConnectionError does
-    # not occur, which happens when the GET call fails due to a network issue
+    # A symbol that failed recently (e.g. an invalid symbol) is not requested again until its backoff is over
+    if alpha_vantage.symbol_backoff.is_blocked(symbol):
+        current_app.logger.info(f'Skipped retrieving the stock data ({symbol}) after recent failures!')
+        return current_price
+
+    # Attempt the GET call to Alpha Vantage and check that a ConnectionError or a Timeout
+    # does not occur, which happens when the GET call fails due to a network issue
     try:
-        r = requests.get(url)
-    except requests.exceptions.ConnectionError:
+        r = alpha_vantage.get(url, priority=priority, stream=True)
+    except CircuitOpen:
+        current_app.logger.warning(f'Alpha Vantage is failing, skipped retrieving the stock data ({symbol})!')
+        return current_price
+    except RateLimitExceeded:
+        current_app.logger.warning(f'API rate limit reached, skipped retrieving the stock data ({symbol})!')
+        return current_price
+    except requests.exceptions.RequestException:
         current_app.logger.error(
             f'Error! Network problem preventing retrieving the stock data ({symbol})!')
+        return current_price
 
     # Status code returned from Alpha Vantage needs to be 200 (OK) to process stock data
     if r.status_code != 200:
         current_app.logger.warning(f'Error! Received unexpected status code ({r.status_code}) '
         f'when retrieving daily stock data ({symbol})!')
+        if r.status_code < 500:
+            alpha_vantage.symbol_backoff.record_failure(symbol)
+        r.close()
         return current_price
 
-    daily_data = r.json()
+    # Only the latest close is needed, so stop parsing the response after the first date
+    chunks = r.iter_content(chunk_size=8192)
+    try:
+        for date, fields in iter_time_series(chunks, 'Time Series (Daily)'):
+            current_price = float(fields['4. close'])
+            break
+
+        # Read the rest of the (compact) response without parsing it, so the connection can be re-used
+        for _ in chunks:
+            pass
+    except MissingTimeSeries as e:
+        # The 'Note' key is returned when the API rate limit has been exceeded,
+        # and the 'Error Message' key when the symbol is invalid
+        if 'Note' in e.payload:
+            alpha_vantage.report_throttled()
+        else:
+            alpha_vantage.symbol_backoff.record_failure(symbol)
 
-    
-    if 'Time Series (Daily)' not in daily_data:
         current_app.logger.warning(f'Could not find the Time Series (Daily) key when retrieving '
         f'the daily stock data ({symbol})!')
+    except (ValueError, KeyError, requests.exceptions.RequestException):
+        alpha_vantage.symbol_backoff.record_failure(symbol)
+        current_app.logger.warning(f'Error! Invalid response when retrieving the daily stock data ({symbol})!')
+    finally:
+        r.close()
+
+    if current_price > 0.0:
+        alpha_vantage.symbol_backoff.record_success(symbol)
+
+    return current_price
+
+
+# ***method to get daily stock data, checking the quote cache first***
+def get_cached_stock_price(symbol: str, priority: int = None) -> float:
+    current_price = quote_cache.get(symbol)
+    if current_price is not None:
+        return current_price
+
+    # Concurrent fetches of the same symbol share a single call to Alpha Vantage
+    return quote_flights.do(symbol.strip().upper(),
+                            lambda: _fetch_and_cache_stock_price(symbol, priority),
+                            lock_dir=current_app.config['QUOTE_FLIGHT_LOCK_DIR'])
+
+
+def _fetch_and_cache_stock_price(symbol: str, priority: int = None) -> float:
+    # Another worker may have cached the price while this one was waiting for the lock
+    current_price = quote_cache.get(symbol)
+    if current_price is not None:
         return current_price
 
-    for element in daily_data['Time Series (Daily)']:
-        current_price = float(daily_data['Time Series (Daily)'][element]['4. close'])
-        break
+    current_price = get_current_stock_price(symbol, priority)
+
+    # Only cache valid prices, so a failed call is retried on the next request
+    if current_price > 0.0:
+        quote_cache.set(symbol, current_price)
 
     return current_price
 
 
+class Security(db.Model):
+    """
+    Class that represents a security (one per stock symbol) and its latest price.
+
+    The following attributes of a security are stored in this table:
+        symbol - stock symbol in upper case (type: string)
+        current price - latest close price (type: float)
+        current price date - when the current price was retrieved (type: datetime)
+
+    Every stock (lot) holding the symbol references this row, so a price change
+    is a single write no matter how many lots hold the symbol.
+    """
+
+    __tablename__ = 'securities'
+
+    symbol = db.Column(db.String, primary_key=True)
+    current_price = db.Column(db.Float)
+    current_price_date = db.Column(db.DateTime)
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol.strip().upper()
+        self.current_price = 0
+        self.current_price_date = None
+
+    def __repr__(self):
+        return f'<Security: {self.symbol} ${self.current_price}>'
+
+    @staticmethod
+    def bulk_update_prices(prices: dict, price_date: datetime = None):
+        """
+        Set the current price of the securities in prices ({symbol: price}).
+
+        This is one UPDATE per symbol (by primary key), run as a single batch
+        (executemany), whatever the number of lots holding the symbols, followed
+        by the recomputation of the summaries of their holders.  The caller commits.
+        """
+        params = [{'b_symbol': symbol.strip().upper(), 'price': price}
+                  for symbol, price in prices.items() if price > 0.0]
+        if not params:
+            return
+
+        securities = Security.__table__
+        statement = securities.update() \
+            .where(securities.c.symbol == db.bindparam('b_symbol')) \
+            .values(current_price=db.bindparam('price'), current_price_date=price_date or datetime.now())
+        db.session.execute(statement, params)
+
+        # The summaries are recomputed from the prices just written (the UPDATE holds the row locks of
+        # the securities), as a delta from a price read earlier drifts with concurrent refreshes
+        connection = db.session.connection()
+        PortfolioSummary.rebuild(connection, holders_of(connection, [param['b_symbol'] for param in params]))
+
+        # The Security objects already loaded in the session hold the old prices
+        db.session.expire_all()
+
+        current_app.logger.debug(f'Updated the current price of {len(params)} securities')
+
+
 class Stock(db.Model):
     """
     Class that represents a purchased stock in a portfolio.
@@ -60,9 +184,12 @@ class Stock(db.Model):
         number of shares (type: integer)
         purchase price (type: integer)
 
+    The current price is the one of the security of the stock symbol.
     """
 
     __tablename__ = 'stocks'
+    # The portfolio page lists the stocks of a user ordered by id
+    __table_args__ = (db.Index('ix_stocks_user_id_id', 'user_id', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     stock_symbol = db.Column(db.String, nullable=False)
@@ -73,9 +200,8 @@ class Stock(db.Model):
 
     purchase_date = db.Column(db.DateTime)
 
-    current_price = db.Column(db.Float)
-    current_price_date = db.Column(db.DateTime)
-    position_value = db.Column(db.Float)
+    security_symbol = db.Column(db.String, db.ForeignKey('securities.symbol'), nullable=False, index=True)
+    security = db.relationship('Security', lazy='joined', innerjoin=True)
 
     def __init__(self, stock_symbol: str, number_of_shares: str, purchase_price: str, user_id: int, purchase_date=None):
         self.stock_symbol = stock_symbol
@@ -86,32 +212,76 @@ class Stock(db.Model):
 
         self.purchase_date = purchase_date
 
-        self.current_price = 0
-        self.current_price_date = None
-        self.position_value = 0
+        # Replaced by the existing security of the symbol, if any, when the stock is saved
+        self.security = Security(stock_symbol)
+        self.security_symbol = self.security.symbol
 
     def __repr__(self):
         return f'{self.stock_symbol} - {self.number_of_shares} shares purchased at ${self.purchase_price}'
 
-    # to retrieve securities data
-    def get_stock_data(self):
-        if self.current_price_date is None or self.current_price_date.date() != datetime.now().date():
+    @property
+    def current_price(self) -> float:
+        return self.security.current_price
 
-            current_price = get_current_stock_price(self.stock_symbol)
+    @current_price.setter
+    def current_price(self, current_price: float):
+        self.security.current_price = current_price
 
-            if current_price > 0.0:
-                self.current_price = current_price
+    @property
+    def current_price_date(self) -> datetime:
+        return self.security.current_price_date
+
+    @current_price_date.setter
+    def current_price_date(self, current_price_date: datetime):
+        self.security.current_price_date = current_price_date
+
+    @property
+    def position_value(self) -> float:
+        return (self.current_price or 0.0) * self.number_of_shares
+
+    # is the current price missing or from a previous day?
+    def is_price_stale(self) -> bool:
+        return self.current_price_date is None or self.current_price_date.date() != datetime.now().date()
 
-                self.current_price_date = datetime.now()
+    def set_current_price(self, current_price: float):
+        self.current_price = current_price
 
-                self.position_value = self.current_price * self.number_of_shares
+        self.current_price_date = datetime.now()
 
-                current_app.logger.debug(f'Retrieved current price {self.current_price} '
-                f'for the stock data ({self.stock_symbol})!')
+        current_app.logger.debug(f'Retrieved current price {self.current_price} '
+        f'for the stock data ({self.stock_symbol})!')
+
+    # to retrieve securities data
+    def get_stock_data(self):
+        if self.is_price_stale():
+
+            current_price = get_cached_stock_price(self.stock_symbol)
+
+            if current_price > 0.0:
+                self.set_current_price(current_price)
 
     def get_stock_position_value(self)-> float:
         return float(self.position_value)
 
+    @staticmethod
+    def _position_value():
+        return db.func.coalesce(Security.current_price, 0.0) * Stock.number_of_shares
+
+    @staticmethod
+    def get_portfolio(user_id: int, after_id: int = None, limit: int = None):
+        """
+        Return a query of the stocks of a user, with the value of each position computed
+        by the database, ordered by id.
+
+        The stocks are paginated by keyset: only the stocks with an id greater than
+        after_id (the last id of the previous page) are returned, up to limit stocks.
+        """
+        query = db.session.query(Stock, Stock._position_value().label('position_value')) \
+                          .join(Stock.security).options(db.contains_eager(Stock.security)) \
+                          .filter(Stock.user_id == user_id)
+        if after_id is not None:
+            query = query.filter(Stock.id > after_id)
+        return query.order_by(Stock.id).limit(limit)
 
     # ***weekly stock price***
     def create_alpha_vantage_get_url_weekly(self):
@@ -121,35 +291,117 @@ class Stock(db.Model):
         current_app.config['API_KEY']
     )
 
-    # ***method to get weekly stock data***
-    def get_weekly_stock_data(self):
-        title = 'Stock chart is unavailable.'
-        labels = []
-        values = []
+    # ***method to add the latest weekly stock data to the price history***
+    def update_weekly_stock_data(self):
+        symbol = self.stock_symbol.upper()
         url = self.create_alpha_vantage_get_url_weekly()
 
+        if alpha_vantage.symbol_backoff.is_blocked(symbol):
+            current_app.logger.info(f'Skipped retrieving the weekly stock data ({symbol}) after recent failures!')
+            return
+
         try:
-            r = requests.get(url)
-        except requests.exceptions.ConnectionError:
+            r = alpha_vantage.get(url, stream=True)
+        except CircuitOpen:
+            current_app.logger.warning(
+                f'Alpha Vantage is failing, skipped retrieving the weekly stock data ({self.stock_symbol})!')
+            return
+        except RateLimitExceeded:
+            current_app.logger.warning(
+                f'API rate limit reached, skipped retrieving the weekly stock data ({self.stock_symbol})!')
+            return
+        except requests.exceptions.RequestException:
             current_app.logger.info(
                 f'Error! Network problem preventing retrieving the weekly stock data ({self.stock_symbol})!')
+            return
 
         # Status code returned from Alpha Vantage needs to be 200 (OK) to process stock data
         if r.status_code != 200:
             current_app.logger.warning(f'Error! Received unexpected status code ({r.status_code}) '
             f'when retrieving weekly stock data ({self.stock_symbol})!')
-            return title, '', ''
-
-        weekly_data = r.json()
+            if r.status_code < 500:
+                alpha_vantage.symbol_backoff.record_failure(symbol)
+            r.close()
+            return
+
+        # Only keep the weeks newer than the stored history.  The latest stored week is
+        # replaced as well, as it may have been stored before the end of that week.
+        latest_date = PriceHistory.get_latest_date(symbol)
+        cutoff_date = None if latest_date is None else latest_date - timedelta(days=7)
+
+        # The weeks are sent from latest to oldest, so stop parsing the response at the cutoff date
+        rows = []
+        try:
+            for element, fields in iter_time_series(r.iter_content(chunk_size=65536), 'Weekly Adjusted Time Series'):
+                date = datetime.fromisoformat(element)
+                if cutoff_date is not None and date <= cutoff_date:
+                    break
+
+                rows.append(PriceHistory(symbol, date, fields))
+        except MissingTimeSeries as e:
+            # The key of 'Weekly Adjusted Time Series' needs to be present in order to process the stock data
+            # Typically, this key will not be present if the API rate limit has been exceeded.
+            if 'Note' in e.payload:
+                alpha_vantage.report_throttled()
+            else:
+                alpha_vantage.symbol_backoff.record_failure(symbol)
 
-        # The key of 'Weekly Adjusted Time Series' needs to be present in order to process the stock data
-        # Typically, this key will not be present if the API rate limit has been exceeded.
-        if 'Weekly Adjusted Time Series' not in weekly_data:
             current_app.logger.warning(f'Could not find the Weekly Adjusted Time Series key when retrieving '
             f'the weekly stock data ({self.stock_symbol})!')
+            return
+        except (ValueError, KeyError, requests.exceptions.RequestException):
+            alpha_vantage.symbol_backoff.record_failure(symbol)
+            current_app.logger.warning(
+                f'Error! Invalid response when retrieving the weekly stock data ({self.stock_symbol})!')
+            return
+        finally:
+            r.close()
+
+        try:
+            if cutoff_date is not None:
+                PriceHistory.query.filter(PriceHistory.symbol == symbol,
+                                          PriceHistory.date > cutoff_date).delete(synchronize_session=False)
+            db.session.add_all(rows)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same weeks at the same time
+            db.session.rollback()
+            return
+
+        current_app.logger.info(f'Stored {len(rows)} weeks of price history ({symbol})!')
+
+    # ***method to get weekly stock data***
+    def get_weekly_stock_data(self):
+        title = 'Stock chart is unavailable.'
+
+        history_query = self._get_weekly_price_history()
+        with replica_reads():
+            history = history_query.all()
+        if not history:
             return title, '', ''
 
         title = f'Weekly Prices ({self.stock_symbol})'
+        labels = [row.date for row in history]
+        values = [row.close for row in history]
+
+        return title, labels, values
+
+    def has_weekly_stock_data(self) -> bool:
+        """Return True if the chart of the stock has data (without loading the price history)."""
+        history_query = self._get_weekly_price_history()
+        with replica_reads():
+            return db.session.query(history_query.exists()).scalar()
+
+    def _get_weekly_price_history(self):
+        """Update the price history of the symbol if needed, and return the query of the weeks of the chart."""
+        symbol = self.stock_symbol.upper()
+
+        # The weekly data is only downloaded once a week, the chart is read from the price history
+        # (from the read replica, unless the history was just updated)
+        with replica_reads():
+            needs_update = PriceHistory.needs_update(symbol)
+        if needs_update:
+            self.update_weekly_stock_data()
 
         # Determine the start date as either:
         #   - If the start date is less than 12 weeks ago, then use the date from 12 weeks ago
@@ -158,17 +410,258 @@ class Stock(db.Model):
         if (datetime.now() - self.purchase_date) < timedelta(weeks=12):
             start_date = datetime.now() - timedelta(weeks=12)
 
-        for element in weekly_data['Weekly Adjusted Time Series']:
-            date = datetime.fromisoformat(element)
-            if date.date() > start_date.date():
-                labels.append(date)
-                values.append(weekly_data['Weekly Adjusted Time Series'][element]['4. close'])
+        return PriceHistory.query.filter(PriceHistory.symbol == symbol,
+                                         PriceHistory.date >= datetime.combine(start_date.date() + timedelta(days=1), time.min)) \
+                                 .order_by(PriceHistory.date)
 
-        # Reverse the elements as the data from Alpha Vantage is read in latest to oldest
-        labels.reverse()
-        values.reverse()
 
-        return title, labels, values
+class PortfolioSummary(db.Model):
+    """
+    Class that represents the totals of the portfolio of a user (one row per user).
+
+    The following attributes of a portfolio are stored in this table:
+        total value - current value of all the stocks (type: float)
+        cost basis - purchase value of all the stocks (type: float)
+        lot count - number of stocks (type: integer)
+        updated at - when the totals last changed (type: datetime)
+
+    The row is updated incrementally when a stock is added or deleted, and
+    recomputed when the price of a security held by the user changes (see the
+    events below), so the totals are read without scanning the stocks of the user.
+    """
+
+    __tablename__ = 'portfolio_summary'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+    cost_basis = db.Column(db.Float, nullable=False, default=0.0)
+    lot_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<PortfolioSummary: user {self.user_id} ${self.total_value} ({self.lot_count} stocks)>'
+
+    @property
+    def version(self) -> tuple:
+        """Values changing with every change of the stocks of the user or of their prices (see conditional.py)."""
+        return self.user_id, self.lot_count, self.total_value, self.updated_at
+
+    @staticmethod
+    def for_user(user_id: int):
+        """Return the summary of a user (an empty one if the user has no stocks)."""
+        summary = db.session.get(PortfolioSummary, user_id)
+        if summary is None:
+            summary = PortfolioSummary(user_id=user_id, total_value=0.0, cost_basis=0.0, lot_count=0)
+        return summary
+
+    @staticmethod
+    def rebuild(connection, user_ids=None):
+        """
+        Recompute the summaries of the users (of every user if user_ids is None) from their stocks.
+
+        The summaries are created if missing and locked (SELECT ... FOR UPDATE) before the stocks
+        are aggregated, so a stock added or deleted concurrently (see add_to_summary()) is either
+        counted by the aggregate or added to the summary after it is rebuilt, never lost.
+        """
+        summaries = PortfolioSummary.__table__
+        stocks = Stock.__table__
+        securities = Security.__table__
+
+        totals = db.select(stocks.c.user_id,
+                           db.func.coalesce(db.func.sum(db.func.coalesce(securities.c.current_price, 0.0) * stocks.c.number_of_shares), 0.0),
+                           db.func.coalesce(db.func.sum(stocks.c.purchase_price * stocks.c.number_of_shares), 0.0),
+                           db.func.count(stocks.c.id)) \
+                   .join_from(stocks, securities, stocks.c.security_symbol == securities.c.symbol) \
+                   .where(stocks.c.user_id.isnot(None)) \
+                   .group_by(stocks.c.user_id)
+        locked = db.select(summaries.c.user_id).with_for_update()
+        now = datetime.now()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            if not user_ids:
+                return
+            totals = totals.where(stocks.c.user_id.in_(user_ids))
+            locked = locked.where(summaries.c.user_id.in_(user_ids))
+            connection.execute(conflict_insert(connection, summaries).on_conflict_do_nothing(index_elements=['user_id']),
+                               [{'user_id': user_id, 'total_value': 0.0, 'cost_basis': 0.0, 'lot_count': 0,
+                                 'updated_at': now} for user_id in user_ids])
+        locked_ids = [user_id for user_id, in connection.execute(locked)]
+
+        # The users left without stocks get a summary of zeros
+        rows = {user_id: {'user_id': user_id, 'total_value': 0.0, 'cost_basis': 0.0, 'lot_count': 0, 'updated_at': now}
+                for user_id in locked_ids}
+        for user_id, total_value, cost_basis, lot_count in connection.execute(totals):
+            rows[user_id] = {'user_id': user_id, 'total_value': total_value, 'cost_basis': cost_basis,
+                             'lot_count': lot_count, 'updated_at': now}
+        if rows:
+            upsert = conflict_insert(connection, summaries)
+            upsert = upsert.on_conflict_do_update(index_elements=['user_id'],
+                                                  set_={'total_value': upsert.excluded.total_value,
+                                                        'cost_basis': upsert.excluded.cost_basis,
+                                                        'lot_count': upsert.excluded.lot_count,
+                                                        'updated_at': upsert.excluded.updated_at})
+            connection.execute(upsert, list(rows.values()))
+
+
+def add_to_summary(connection, user_id: int, total_value: float, cost_basis: float, lot_count: int):
+    """Add the deltas to the summary of a user (creating it for the first stock of the user), in a single upsert."""
+    if user_id is None:
+        return
+
+    summaries = PortfolioSummary.__table__
+    upsert = conflict_insert(connection, summaries).values(user_id=user_id, total_value=total_value, cost_basis=cost_basis,
+                                                           lot_count=lot_count, updated_at=datetime.now())
+    connection.execute(upsert.on_conflict_do_update(index_elements=['user_id'],
+                                                    set_={'total_value': summaries.c.total_value + upsert.excluded.total_value,
+                                                          'cost_basis': summaries.c.cost_basis + upsert.excluded.cost_basis,
+                                                          'lot_count': summaries.c.lot_count + upsert.excluded.lot_count,
+                                                          'updated_at': upsert.excluded.updated_at}))
+
+
+def holders_of(connection, symbols) -> list:
+    """Return the IDs of the users holding any of the symbols."""
+    stocks = Stock.__table__
+    holders = connection.execute(db.select(stocks.c.user_id).distinct()
+                                   .where(stocks.c.security_symbol.in_(list(symbols)), stocks.c.user_id.isnot(None)))
+    return [user_id for user_id, in holders]
+
+
+def _security_price(connection, symbol: str) -> float:
+    securities = Security.__table__
+    price = connection.execute(db.select(securities.c.current_price).where(securities.c.symbol == symbol)).scalar()
+    return price or 0.0
+
+
+@db.event.listens_for(Stock, 'after_insert')
+def add_stock_to_summary(mapper, connection, stock):
+    price = _security_price(connection, stock.security_symbol)
+    add_to_summary(connection, stock.user_id, price * stock.number_of_shares,
+                   stock.purchase_price * stock.number_of_shares, 1)
+
+
+@db.event.listens_for(Stock, 'after_delete')
+def remove_stock_from_summary(mapper, connection, stock):
+    price = _security_price(connection, stock.security_symbol)
+    add_to_summary(connection, stock.user_id, -price * stock.number_of_shares,
+                   -stock.purchase_price * stock.number_of_shares, -1)
+
+
+@db.event.listens_for(Stock, 'after_update')
+def rebuild_summary_of_updated_stock(mapper, connection, stock):
+    user_ids = {stock.user_id, *db.inspect(stock).attrs.user_id.history.deleted} - {None}
+    PortfolioSummary.rebuild(connection, user_ids)
+
+
+@db.event.listens_for(Security, 'after_update')
+def rebuild_summaries_of_holders(mapper, connection, security):
+    if db.inspect(security).attrs.current_price.history.has_changes():
+        # Recomputed from the price just written, not from the (possibly stale) previous price of the object
+        PortfolioSummary.rebuild(connection, holders_of(connection, [security.symbol]))
+
+
+def conflict_insert(connection, table):
+    """Return an INSERT of the table accepting an ON CONFLICT clause (PostgreSQL and SQLite)."""
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(table)
+
+
+# A new stock shares the existing security of its symbol, instead of inserting a duplicate
+@db.event.listens_for(SignallingSession, 'before_flush')
+def attach_new_stocks_to_securities(session, flush_context, instances):
+    securities = {}
+    for stock in [obj for obj in session.new if isinstance(obj, Stock)]:
+        security = securities.get(stock.security_symbol)
+        if security is None:
+            with session.no_autoflush:
+                security = session.get(Security, stock.security_symbol)
+                if security is None:
+                    # Another session may be adding the same symbol: the security is inserted unless it
+                    # exists by then (waiting for that session to commit), instead of failing on its key
+                    connection = session.connection()
+                    connection.execute(conflict_insert(connection, Security.__table__)
+                                       .values(symbol=stock.security_symbol, current_price=0.0)
+                                       .on_conflict_do_nothing(index_elements=['symbol']))
+                    security = session.get(Security, stock.security_symbol)
+            securities[stock.security_symbol] = security
+
+        pending = stock.security
+        if pending is not security:
+            # Keep the most recent of the two prices
+            if pending is not None and pending.current_price_date and (security.current_price_date is None or
+                                               pending.current_price_date > security.current_price_date):
+                security.current_price = pending.current_price
+                security.current_price_date = pending.current_price_date
+            stock.security = security
+            if pending is not None and pending in session.new:
+                session.expunge(pending)
+
+
+class PriceHistory(db.Model):
+    """
+    Class that represents the weekly price history of a stock symbol.
+
+    The following attributes are stored in this table:
+        symbol (type: string)
+        date - last trading day of the week (type: datetime)
+        close, adjusted close (type: float)
+        volume (type: integer)
+
+    """
+
+    __tablename__ = 'price_history'
+    __table_args__ = (db.UniqueConstraint('symbol', 'date', name='uq_price_history_symbol_date'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    adjusted_close = db.Column(db.Float)
+    volume = db.Column(db.BigInteger)
+
+    def __init__(self, symbol: str, date: datetime, fields: dict):
+        self.symbol = symbol
+        self.date = date
+        self.close = float(fields['4. close'])
+        self.adjusted_close = float(fields['5. adjusted close']) if '5. adjusted close' in fields else None
+        self.volume = int(fields['6. volume']) if '6. volume' in fields else None
+
+    def __repr__(self):
+        return f'{self.symbol} - {self.date.strftime("%Y-%m-%d")}: ${self.close}'
+
+    @staticmethod
+    def get_latest_date(symbol: str):
+        return db.session.query(db.func.max(PriceHistory.date)).filter(PriceHistory.symbol == symbol).scalar()
+
+    @staticmethod
+    def needs_update(symbol: str) -> bool:
+        """A newer week can only be available once the latest stored week is over."""
+        return PriceHistory.is_outdated(PriceHistory.get_latest_date(symbol))
+
+    @staticmethod
+    def is_outdated(latest_date) -> bool:
+        refresh_days = current_app.config['PRICE_HISTORY_REFRESH_DAYS']
+        return latest_date is None or (datetime.now() - latest_date) >= timedelta(days=refresh_days)
+
+
+class TokenBucket(db.Model):
+    """
+    Class that represents a token bucket of the Alpha Vantage rate limiter
+    (see rate_limit.DatabaseBucketStore), so every process spends the same quota.
+
+    The following attributes of a bucket are stored in this table:
+        name - calls/period of the limit, e.g. '5/60' (type: string)
+        tokens - calls available when the bucket was last updated (type: float)
+        updated at - when the bucket was last updated, in seconds since the epoch (type: float)
+    """
+
+    __tablename__ = 'token_buckets'
+
+    name = db.Column(db.String, primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<TokenBucket: {self.name} {self.tokens} tokens>'
 
 
 class User(db.Model):
@@ -240,4 +733,46 @@ class User(db.Model):
         return str(self.id)
 
     def set_password(self, password_plaintext: str):
-        self.password_hashed = self._generate_password_hash(password_plaintext)
\ No newline at end of file
+        self.password_hashed = self._generate_password_hash(password_plaintext)
+
+    @staticmethod
+    def load(user_id: int):
+        """
+        Return the user with this id (used by Flask-Login on every request).
+
+        The column values are served from the user cache when possible, and the
+        user is attached to the session without querying the database.
+        """
+        values = user_cache.get(user_id)
+        if values is None:
+            user = User.query.get(user_id)
+            if user is not None:
+                user_cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs})
+            return user
+
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+# The cached users are deleted when they are updated (e.g. set_password() or the email
+# confirmation), at flush time and again after the commit, in case another request
+# cached the previous values in between
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    user_cache.delete(user.id)
+    object_session(user).info.setdefault('updated_user_ids', set()).add(user.id)
+
+
+@db.event.listens_for(SignallingSession, 'after_commit')
+def invalidate_committed_users(session):
+    for user_id in session.info.pop('updated_user_ids', ()):
+        user_cache.delete(user_id)
+
+
+@db.event.listens_for(SignallingSession, 'after_soft_rollback')
+def forget_updated_users(session, previous_transaction):
+    session.info.pop('updated_user_ids', None)
@@ -0,0 +1,152 @@
+"""
+Metrics of the database connection pools.
+
+instrument_engine() replaces engine.connect() on the engine instance with a
+wrapper timing every connection request (the checkout of a connection from the
+pool, including the time spent opening a new connection): the pool events only
+fire once a connection is checked out, so none of them marks the start of a
+wait.  The checkout, checkin and connect pool events, registered with
+event.listen(), keep count of the active and opened connections.
+
+A slow checkout is logged with the state of the pool, and a summary of the
+metrics is logged periodically, so the gunicorn threads stalling on an
+exhausted pool show up in the logs.  The metrics of the current process are
+available as get_pool_metrics(db.engine).snapshot().
+"""
+import threading
+import time
+import weakref
+from functools import wraps
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Metrics of the instrumented engines
+_engine_metrics = weakref.WeakKeyDictionary()
+
+class PoolMetrics(object):
+    """Counters of the checkouts of a connection pool (thread-safe)."""
+
+    def __init__(self, timer=time.monotonic):
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._last_report = timer()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.active = 0
+        self.peak_active = 0
+        self.connections_opened = 0
+
+    def record_checkout(self, wait: float, slow: bool):
+        """Record the time taken by a checkout; slow is True if it took longer than the slow checkout threshold."""
+        with self._lock:
+            self.checkouts += 1
+            self.slow_checkouts += 1 if slow else 0
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self, wait: float):
+        with self._lock:
+            self.slow_checkouts += 1
+            self.timeouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def connection_checked_out(self):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def connection_checked_in(self):
+        with self._lock:
+            self.active = max(self.active - 1, 0)
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'checkouts': self.checkouts,
+                    'slow_checkouts': self.slow_checkouts,
+                    'timeouts': self.timeouts,
+                    'average_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+                    'max_wait': self.max_wait,
+                    'active': self.active,
+                    'peak_active': self.peak_active,
+                    'connections_opened': self.connections_opened}
+
+    def report_due(self, interval: float) -> bool:
+        """Return True (once per interval) when the metrics should be reported."""
+        if interval <= 0:
+            return False
+
+        with self._lock:
+            now = self._timer()
+            if now - self._last_report < interval:
+                return False
+            self._last_report = now
+            return True
+
+
+def get_pool_metrics(engine):
+    """Return the PoolMetrics of an instrumented engine (None if it is not instrumented)."""
+    return _engine_metrics.get(engine)
+
+
+def instrument_engine(engine):
+    """Record the metrics of the connection pool of the engine; returns the engine."""
+    metrics = PoolMetrics()
+    _engine_metrics[engine] = metrics
+    # The pool events registered on the engine also apply to the pool recreated by engine.dispose()
+    event.listen(engine, 'checkout', lambda *args: metrics.connection_checked_out())
+    event.listen(engine, 'checkin', lambda *args: metrics.connection_checked_in())
+    event.listen(engine, 'connect', lambda *args: metrics.connection_opened())
+
+    connect = engine.connect
+
+    @wraps(connect)
+    def timed_connect(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            connection = connect(*args, **kwargs)
+        except PoolTimeoutError:
+            metrics.record_timeout(time.monotonic() - start)
+            if has_app_context():
+                current_app.logger.error(f'Error! Timed out waiting for a database connection ({engine.pool.status()})')
+            raise
+
+        wait = time.monotonic() - start
+        slow = has_app_context() and wait >= current_app.config['DATABASE_POOL_SLOW_CHECKOUT']
+        metrics.record_checkout(wait, slow)
+        if has_app_context():
+            _log_metrics(engine, metrics, wait, slow)
+        return connection
+
+    # Not a SQLAlchemy hook: the attribute of the instance shadows Engine.connect(), through
+    # which the sessions (and engine.execute()) check their connections out
+    engine.connect = timed_connect
+    return engine
+
+
+def _log_metrics(engine, metrics: PoolMetrics, wait: float, slow: bool):
+    if slow:
+        current_app.logger.warning(f'Waited {wait * 1000:.0f} ms for a database connection ({engine.pool.status()})')
+
+    if metrics.report_due(current_app.config['DATABASE_POOL_METRICS_INTERVAL']):
+        snapshot = metrics.snapshot()
+        current_app.logger.info(f'Database pool: {snapshot["checkouts"]} checkouts, '
+                                f'{snapshot["slow_checkouts"]} slow checkouts, {snapshot["timeouts"]} timeouts, '
+                                f'average wait {snapshot["average_wait"] * 1000:.1f} ms, '
+                                f'max wait {snapshot["max_wait"] * 1000:.0f} ms, '
+                                f'{snapshot["active"]} active connections (peak {snapshot["peak_active"]}), '
+                                f'{snapshot["connections_opened"]} connections opened')
+
+
+def configure_pool_metrics(app):
+    app.config.setdefault('DATABASE_POOL_SLOW_CHECKOUT', 0.1)
+    app.config.setdefault('DATABASE_POOL_METRICS_INTERVAL', 300)
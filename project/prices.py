@@ -0,0 +1,167 @@
+"""
+Refresh the current price of many stocks at once.
+
+The distinct symbols with a stale price are fetched concurrently on a bounded
+thread pool, and each price is stored once on the security of its symbol,
+which every lot holding the symbol shares (with a single batch of UPDATE
+statements for the background refreshes).
+
+refresh_all_stock_prices() is run by the 'flask stocks refresh-prices' command,
+so the prices are kept fresh off the request path.
+
+revalidate_stock_prices() implements the stale-while-revalidate policy of the
+portfolio page: stale prices are rendered right away and refreshed by a
+background thread, unless they are older than the maximum staleness.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+
+from project import alpha_vantage, db
+from project.models import Security, Stock, get_cached_stock_price
+from project.rate_limit import BACKGROUND
+
+
+def fetch_stock_prices(symbols, max_workers: int = None, priority: int = None) -> dict:
+    """Fetch the current price of each symbol concurrently; returns {symbol: price}."""
+    symbols = sorted(set(symbols))
+    if not symbols:
+        return {}
+
+    if max_workers is None:
+        max_workers = current_app.config['PRICE_REFRESH_MAX_WORKERS']
+
+    # The worker threads have no request context, so pass on the priority of the caller
+    if priority is None:
+        priority = alpha_vantage.default_priority()
+
+    app = current_app._get_current_object()
+
+    # Each thread needs its own application context to read the config and log
+    def fetch(symbol):
+        with app.app_context():
+            return symbol, get_cached_stock_price(symbol, priority)
+
+    if len(symbols) == 1 or max_workers <= 1:
+        return dict(fetch(symbol) for symbol in symbols)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(symbols)),
+                            thread_name_prefix='price-refresh') as executor:
+        return dict(executor.map(fetch, symbols))
+
+
+def refresh_stock_prices(stocks, max_workers: int = None, priority: int = None) -> dict:
+    """
+    Update the current price of the stocks whose price is stale.
+
+    Returns the prices that were fetched ({symbol: price}); a price of 0.0
+    means the price could not be retrieved, so those stocks are left as-is.
+    """
+    stale_stocks = [stock for stock in stocks if stock.is_price_stale()]
+    prices = fetch_stock_prices((stock.security_symbol for stock in stale_stocks), max_workers, priority)
+
+    for stock in stale_stocks:
+        current_price = prices.get(stock.security_symbol, 0.0)
+        if current_price > 0.0:
+            stock.set_current_price(current_price)
+
+    return prices
+
+
+def refresh_all_stock_prices(max_workers: int = None) -> int:
+    """Update the stale prices of every security held in the database; returns the number of securities updated."""
+    start_of_today = datetime.combine(datetime.now().date(), datetime.min.time())
+    held = db.session.query(Stock.id).filter(Stock.security_symbol == Security.symbol).exists()
+    stale_symbols = [symbol for symbol, in db.session.query(Security.symbol)
+                                                     .filter(or_(Security.current_price_date.is_(None),
+                                                                 Security.current_price_date < start_of_today))
+                                                     .filter(held)]
+
+    prices = fetch_stock_prices(stale_symbols, max_workers, priority=BACKGROUND)
+    updated = update_stored_stock_prices(prices)
+
+    current_app.logger.info(f'Refreshed the prices of {updated} of {len(stale_symbols)} stale securities')
+    return updated
+
+
+def run_price_refresher(interval: float):
+    """Refresh the stale prices every interval seconds, until interrupted."""
+    current_app.logger.info(f'Starting the price refresher (every {interval} seconds)...')
+    while True:
+        try:
+            refresh_all_stock_prices()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Error! Failed to refresh the stock prices!')
+        finally:
+            db.session.remove()
+
+        time.sleep(interval)
+
+
+# Symbols being refreshed by a background thread of this process
+_revalidating_symbols = set()
+_revalidating_lock = threading.Lock()
+
+
+def update_stored_stock_prices(prices: dict) -> int:
+    """Apply the fetched prices ({symbol: price}) to the securities in the database; returns the number of securities updated."""
+    prices = {symbol: price for symbol, price in prices.items() if price > 0.0}
+    if prices:
+        Security.bulk_update_prices(prices)
+        db.session.commit()
+    return len(prices)
+
+
+def _revalidate_in_background(app, symbols):
+    with app.app_context():
+        try:
+            prices = fetch_stock_prices(symbols, priority=BACKGROUND)
+            updated = update_stored_stock_prices(prices)
+            app.logger.info(f'Revalidated the prices of {updated} of {len(symbols)} symbols ({", ".join(sorted(symbols))})')
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Error! Failed to revalidate the stock prices!')
+        finally:
+            db.session.remove()
+            with _revalidating_lock:
+                _revalidating_symbols.difference_update(symbols)
+
+
+def start_background_refresh(symbols):
+    """Refresh the prices of the symbols in a background thread (unless already in progress)."""
+    with _revalidating_lock:
+        symbols = set(symbols) - _revalidating_symbols
+        _revalidating_symbols.update(symbols)
+
+    if symbols:
+        thread = threading.Thread(target=_revalidate_in_background,
+                                  args=[current_app._get_current_object(), symbols],
+                                  name='price-revalidate', daemon=True)
+        thread.start()
+
+
+def revalidate_stock_prices(stocks) -> list:
+    """
+    Stale-while-revalidate policy for the stocks displayed on a page.
+
+    The stale prices older than PRICE_MAX_STALENESS seconds (or never fetched) are
+    refreshed right away; the other stale prices are refreshed by a background thread.
+    Returns the stocks that are displayed with a stale price.
+    """
+    max_staleness = timedelta(seconds=current_app.config['PRICE_MAX_STALENESS'])
+    now = datetime.now()
+
+    stale_stocks = [stock for stock in stocks if stock.is_price_stale()]
+    too_stale_stocks = [stock for stock in stale_stocks
+                        if stock.current_price_date is None or now - stock.current_price_date > max_staleness]
+    if too_stale_stocks:
+        refresh_stock_prices(too_stale_stocks)
+
+    stale_stocks = [stock for stock in stale_stocks if stock.is_price_stale()]
+    start_background_refresh(stock.security_symbol for stock in stale_stocks)
+    return stale_stocks
@@ -0,0 +1,208 @@
+"""
+Rate limiting of the outbound calls to the Alpha Vantage API.
+
+RateLimiter is a set of token buckets (e.g. 5 calls per minute and 500 calls
+per day) checked and consumed together.  The bucket state is kept in memory
+(per process), in a SQLite file (shared by the gunicorn workers of a host) or
+in the application database, so the web and worker dynos spend the same quota.
+
+PriorityScheduler hands out the tokens of a RateLimiter in priority order, so
+interactive page fetches are served before background refreshes.  Background
+calls also leave a reserve of tokens untouched for the interactive ones.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from project.sqlite import SQLiteConnections
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+def _refill(tokens: float, updated_at: float, now: float, capacity: float, period: float) -> float:
+    """Return the number of tokens in a bucket after refilling it up to now."""
+    elapsed = max(now - updated_at, 0.0)
+    return min(capacity, tokens + elapsed * capacity / period)
+
+
+class MemoryBucketStore(object):
+    """Token bucket state kept in the memory of the current process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def transaction(self, update):
+        """Call update(buckets) atomically; buckets maps name -> (tokens, updated_at)."""
+        with self._lock:
+            return update(self._buckets)
+
+
+class SQLiteBucketStore(object):
+    """Token bucket state kept in a SQLite file, shared by all the processes on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+
+        self._connect().execute('CREATE TABLE IF NOT EXISTS token_buckets ('
+                                'name TEXT PRIMARY KEY, '
+                                'tokens REAL NOT NULL, '
+                                'updated_at REAL NOT NULL)')
+
+    def _connect(self):
+        return self._connections.get()
+
+    def transaction(self, update):
+        """Call update(buckets) atomically across processes (BEGIN IMMEDIATE locks the file)."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            buckets = {name: (tokens, updated_at)
+                       for name, tokens, updated_at in conn.execute('SELECT name, tokens, updated_at FROM token_buckets')}
+            result = update(buckets)
+            conn.executemany('INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                             [(name, tokens, updated_at) for name, (tokens, updated_at) in buckets.items()])
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class DatabaseBucketStore(object):
+    """
+    Token bucket state kept in a table of the application database (see models.TokenBucket),
+    shared by all the processes of every host.
+    """
+
+    def __init__(self, engine, table):
+        self.engine = engine
+        self.table = table
+
+    def transaction(self, update):
+        """Call update(buckets) atomically across processes (the rows of the buckets are locked)."""
+        try:
+            return self._transaction(update)
+        except IntegrityError:
+            # Another process inserted a missing bucket first, so its row can now be locked
+            return self._transaction(update)
+
+    def _transaction(self, update):
+        table = self.table
+        with self.engine.begin() as conn:
+            stored = {name: (tokens, updated_at) for name, tokens, updated_at in
+                      conn.execute(select(table.c.name, table.c.tokens, table.c.updated_at).with_for_update())}
+            buckets = dict(stored)
+            result = update(buckets)
+            for name, (tokens, updated_at) in buckets.items():
+                if name in stored:
+                    conn.execute(table.update().where(table.c.name == name).values(tokens=tokens, updated_at=updated_at))
+                else:
+                    conn.execute(table.insert().values(name=name, tokens=tokens, updated_at=updated_at))
+            return result
+
+
+class RateLimiter(object):
+    """
+    Set of token buckets that are checked and consumed together.
+
+    limits is a list of (number of calls, period in seconds), for example
+    [(5, 60), (500, 86400)] for 5 calls per minute and 500 calls per day.
+    """
+
+    def __init__(self, limits, store=None, timer=time.time):
+        self.limits = [(f'{calls}/{period}', float(calls), float(period)) for calls, period in limits if calls > 0]
+        self.store = store or MemoryBucketStore()
+        self._timer = timer
+
+    def try_acquire(self, reserve: float = 0) -> float:
+        """
+        Take one token from every bucket if each one holds more than the reserve.
+
+        Returns 0.0 if the tokens were taken, otherwise the number of seconds to
+        wait before a token is expected to be available.
+        """
+        if not self.limits:
+            return 0.0
+
+        def update(buckets):
+            now = self._timer()
+            wait = 0.0
+            levels = {}
+            for name, capacity, period in self.limits:
+                tokens, updated_at = buckets.get(name, (capacity, now))
+                tokens = _refill(tokens, updated_at, now, capacity, period)
+                levels[name] = tokens
+                needed = 1.0 + min(reserve, capacity - 1.0)
+                if tokens < needed:
+                    wait = max(wait, (needed - tokens) * period / capacity)
+
+            for name, capacity, period in self.limits:
+                buckets[name] = (levels[name] - (1.0 if wait == 0.0 else 0.0), now)
+            return wait
+
+        return self.store.transaction(update)
+
+    def drain(self):
+        """Empty the shortest bucket (called when the API reports that the calls are throttled)."""
+        if not self.limits:
+            return
+
+        name = min(self.limits, key=lambda limit: limit[2])[0]
+
+        def update(buckets):
+            buckets[name] = (0.0, self._timer())
+
+        self.store.transaction(update)
+
+
+class PriorityScheduler(object):
+    """
+    Hands out the tokens of a RateLimiter to the waiting threads in priority order.
+
+    A thread only tries to take a token once it is at the head of the queue, so a
+    background refresh never takes a token while an interactive fetch is waiting
+    in the same process.  Background calls also leave background_reserve tokens
+    for the interactive calls made by the other processes.
+    """
+
+    def __init__(self, limiter: RateLimiter, background_reserve: float = 0, timer=time.monotonic):
+        self.limiter = limiter
+        self.background_reserve = background_reserve
+        self._timer = timer
+        self._waiting = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int = INTERACTIVE, timeout: float = None) -> bool:
+        """Wait for a token; returns False if none was available before the timeout."""
+        deadline = None if timeout is None else self._timer() + timeout
+        reserve = self.background_reserve if priority > INTERACTIVE else 0
+        entry = (priority, next(self._counter))
+
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = 1.0
+                    if self._waiting[0] == entry:
+                        wait = self.limiter.try_acquire(reserve)
+                        if wait == 0.0:
+                            return True
+
+                    if deadline is not None:
+                        remaining = deadline - self._timer()
+                        if remaining <= 0:
+                            return False
+                        wait = min(wait, remaining)
+                    self._condition.wait(wait)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
@@ -0,0 +1,89 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, the other threads asking for the same key
+wait for it and share its result, instead of making the same call again.
+
+Optionally, the calls are also coordinated across processes with a lock file
+per key (only on platforms with fcntl), so only one gunicorn worker at a time
+makes the call; the others can then read its result from a shared cache.
+"""
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on a file, shared by all the processes on the host."""
+    if fcntl is None:
+        yield
+        return
+
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class SingleFlight(object):
+    """Coalesces the concurrent calls made with the same key (thread-safe)."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, function, lock_dir: str = None):
+        """
+        Call function() unless a call for the same key is already in flight,
+        in which case wait for it and return its result (or raise its exception).
+
+        If lock_dir is set, the call also holds a lock file for the key, so that
+        the processes sharing lock_dir make the call one at a time.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if lock_dir:
+                os.makedirs(lock_dir, exist_ok=True)
+                with file_lock(os.path.join(lock_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', key) + '.lock')):
+                    call.result = function()
+            else:
+                call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
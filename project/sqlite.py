@@ -0,0 +1,34 @@
+"""
+Connections to the SQLite files shared by all the processes on the host
+(the SQLiteCache of cache.py and the SQLiteBucketStore of rate_limit.py).
+"""
+import os
+import sqlite3
+import threading
+
+
+class SQLiteConnections(object):
+    """
+    Connections to a SQLite file in autocommit mode with a WAL journal, one per
+    thread and per process, as a connection must not be shared across threads
+    or across a fork().
+    """
+
+    def __init__(self, path: str, synchronous: str = None):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def get(self) -> sqlite3.Connection:
+        """Return the connection of the current thread, opened on its first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            if self.synchronous:
+                conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
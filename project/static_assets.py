@@ -0,0 +1,142 @@
+"""
+Fingerprinted, precompressed static files.
+
+'flask build-static' copies every file of the static folder into its build/
+subfolder under a name holding a hash of its content (css/base_style.css ->
+build/css/base_style.1a2b3c4d5e.css), with gzip and brotli variants of the
+text files, and writes the mapping of the names to build/manifest.json.
+
+When the manifest exists, url_for('static', filename=...) returns the URL of
+the fingerprinted file, which is served with a one-year immutable
+Cache-Control (its name changes with its content), and as the brotli or gzip
+variant when the browser accepts it.  The files missing from the manifest
+are served as usual.
+
+The brotli variants are only written if the brotli package is installed.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover (optional dependency)
+    brotli = None
+
+BUILD_FOLDER = 'build'
+MANIFEST = 'manifest.json'
+
+# The images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico'}
+
+# Extension and Content-Encoding of the variants, by order of preference
+ENCODINGS = [('.br', 'br'), ('.gz', 'gzip')]
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def configure_static_assets(app):
+    app.config.setdefault('STATIC_FINGERPRINTING', True)
+
+    @app.cli.command('build-static')
+    def build_static_command():
+        """Write the fingerprinted and compressed static files, and their manifest"""
+        manifest = build_static_assets(app.static_folder)
+        click.echo(f'Built {len(manifest)} static files in {os.path.join(app.static_folder, BUILD_FOLDER)}.')
+
+    manifest = load_manifest(app.static_folder) if app.config['STATIC_FINGERPRINTING'] else {}
+    app.extensions['static_manifest'] = manifest
+    if not manifest:
+        return
+
+    fingerprinted = set(manifest.values())
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def send_static_file(filename):
+        if filename not in fingerprinted:
+            return app.send_static_file(filename)
+        return send_fingerprinted_file(app.static_folder, filename)
+
+    app.view_functions['static'] = send_static_file
+
+
+def load_manifest(static_folder: str) -> dict:
+    """Return the mapping of the static files to their fingerprinted files (empty if they were not built)."""
+    path = os.path.join(static_folder, BUILD_FOLDER, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def send_fingerprinted_file(static_folder: str, filename: str):
+    """Send a fingerprinted file (or its variant accepted by the browser), to be cached for a year."""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for extension, encoding in ENCODINGS:
+        if request.accept_encodings[encoding] > 0 and os.path.exists(os.path.join(static_folder, filename + extension)):
+            response = send_from_directory(static_folder, filename + extension, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(static_folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def build_static_assets(static_folder: str) -> dict:
+    """Write the fingerprinted files (and their compressed variants) of the static folder; returns the manifest."""
+    build_folder = os.path.join(static_folder, BUILD_FOLDER)
+    shutil.rmtree(build_folder, ignore_errors=True)
+
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        # Skip the build folder being written
+        subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories
+                                   if os.path.join(directory, subdirectory) != build_folder)
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as source:
+                content = source.read()
+
+            stem, extension = os.path.splitext(name)
+            fingerprinted_name = f'{BUILD_FOLDER}/{stem}.{hashlib.sha256(content).hexdigest()[:10]}{extension}'
+            fingerprinted_path = os.path.join(static_folder, *fingerprinted_name.split('/'))
+            os.makedirs(os.path.dirname(fingerprinted_path), exist_ok=True)
+            _write(fingerprinted_path, content)
+
+            if extension.lower() in COMPRESSIBLE_EXTENSIONS:
+                _write_if_smaller(fingerprinted_path + '.gz', gzip.compress(content, compresslevel=9, mtime=0), content)
+                if brotli is not None:
+                    _write_if_smaller(fingerprinted_path + '.br', brotli.compress(content), content)
+
+            manifest[name] = fingerprinted_name
+
+    os.makedirs(build_folder, exist_ok=True)
+    with open(os.path.join(build_folder, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def _write(path: str, content: bytes):
+    with open(path, 'wb') as output:
+        output.write(content)
+
+
+def _write_if_smaller(path: str, compressed: bytes, content: bytes):
+    if len(compressed) < len(content):
+        _write(path, compressed)
@@ -1,12 +1,16 @@
 from . import stocks_blueprint
 import click
 
-from flask import current_app, render_template, request, session, flash, redirect, url_for, abort
+from flask import current_app, render_template, request, session, flash, redirect, url_for, abort, Response, stream_with_context, make_response, jsonify
 
 from flask_login import login_required, current_user
 from datetime import datetime
 
-from project.models import Stock
+from project.conditional import add_validators, conditional_get_enabled, make_etag, not_modified
+from project.db_routing import read_only
+from project.downsampling import lttb
+from project.models import PortfolioSummary, PriceHistory, Stock
+from project.prices import refresh_stock_prices, refresh_all_stock_prices, revalidate_stock_prices, run_price_refresher
 from project import db
 
 # ****callbacks functions****
@@ -50,21 +54,66 @@ def add_stock():
         return redirect(url_for('stocks.stocks'))
     return render_template('stocks/add_stock.html')
 
+def stream_template(template_name, **context):
+    """Render a template as a stream, so the first rows are sent before the whole page is rendered."""
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    # Send the page in chunks of 64 template fragments instead of fragment by fragment
+    stream.enable_buffering(64)
+    return Response(stream_with_context(stream), mimetype='text/html')
+
 # list of stocks in portolio
 @stocks_blueprint.route('/stocks/', methods=['GET', 'POST'])
 @login_required
+@read_only
 def stocks():
-    stocks = Stock.query.order_by(Stock.id).filter_by(user_id=current_user.id).all()
-
-    current_account_value = 0.0
-    for stock in stocks:
-        stock.get_stock_data()
-        db.session.add(stock)
-        current_account_value += stock.get_stock_position_value()
-
-    db.session.commit()
-
-    return render_template('stocks/stock.html', stocks = stocks, value=format(current_account_value, ','))
+    # Keyset pagination: 'after' is the id of the last stock of the previous page
+    after_id = request.args.get('after', type=int)
+    per_page = current_app.config['STOCKS_PER_PAGE'] or None
+    refresh_on_view = current_app.config['PRICE_STALE_WHILE_REVALIDATE'] or current_app.config['PRICE_REFRESH_ON_VIEW']
+
+    # The portfolio summary changes with every change of the stocks or of their prices, so
+    # the page is not modified if the summary is unchanged (unless the page refreshes the prices)
+    summary = PortfolioSummary.for_user(current_user.id)
+    etag = None
+    if not refresh_on_view and conditional_get_enabled():
+        etag = make_etag('stocks', *summary.version, after_id, per_page)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+    # The prices are normally kept fresh by 'flask stocks refresh-prices', so the page
+    # only reads from the database; otherwise either render the stale prices and
+    # refresh them in the background, or fetch the stale prices concurrently
+    stale_stocks = []
+    if refresh_on_view:
+        stocks = [stock for stock, _ in Stock.get_portfolio(current_user.id, after_id, per_page)]
+        if current_app.config['PRICE_STALE_WHILE_REVALIDATE']:
+            stale_stocks = revalidate_stock_prices(stocks)
+        else:
+            refresh_stock_prices(stocks)
+
+        # Only write to the database if a price was actually updated
+        if db.session.dirty:
+            db.session.commit()
+
+    # The value of each position is computed by the database and the total value (of all
+    # the pages) is read from the portfolio summary; one more stock than displayed is
+    # queried to know if there is a next page
+    holdings = Stock.get_portfolio(current_user.id, after_id, per_page + 1 if per_page else None)
+    context = dict(value=format(summary.total_value, ','), per_page=per_page,
+                   stale_ids={stock.id for stock in stale_stocks})
+
+    if current_app.config['STOCKS_STREAM_RENDERING']:
+        response = stream_template('stocks/stock.html', stocks=holdings.yield_per(current_app.config['STOCKS_STREAM_BUFFER']),
+                                   **context)
+    else:
+        response = make_response(render_template('stocks/stock.html', stocks=holdings.all(), **context))
+
+    if etag is not None:
+        add_validators(response, etag)
+    return response
 
 # custom CLI definitions
 @stocks_blueprint.cli.command('create_default_set')
@@ -89,6 +138,24 @@ def create(symbol, number_of_shares, purchase_price):
     db.session.add(stock)
     db.session.commit()
 
+@stocks_blueprint.cli.command('refresh-prices')
+@click.option('--loop', is_flag=True, help='Keep running and refresh the prices every INTERVAL seconds.')
+@click.option('--interval', default=300, show_default=True, help='Seconds between two refreshes (with --loop).')
+def refresh_prices(loop, interval):
+    """Refresh the current price of every stock with a stale price"""
+    if loop:
+        run_price_refresher(interval)
+    else:
+        updated = refresh_all_stock_prices()
+        click.echo(f'Refreshed the prices of {updated} securities.')
+
+@stocks_blueprint.cli.command('rebuild-summaries')
+def rebuild_summaries():
+    """Recompute the portfolio summary of every user from their stocks"""
+    PortfolioSummary.rebuild(db.session.connection())
+    db.session.commit()
+    click.echo('Rebuilt the portfolio summaries.')
+
 @stocks_blueprint.route("/chartjs_demo1")
 def chartjs_demo1():
     return render_template('stocks/chartjs_demo1.html')
@@ -114,13 +181,71 @@ def chartjs_demo3():
     values = [10.3, 9.2, 8.7, 7.1, 6.0, 14.4, 7.6, 8.9]
     return render_template('stocks/chartjs_demo3.html', values=values, labels=labels, title=title)
 
-@stocks_blueprint.route('/stocks/<id>')
-@login_required
-def stock_details(id):
+def get_stock_of_current_user(id):
     stock = Stock.query.filter_by(id=id).first_or_404()
 
     if stock.user_id != current_user.id:
         abort(403)
+    return stock
+
+def stock_etag(stock, *version):
+    """
+    Return the ETag of the pages of a stock (None if they must be rendered).
+
+    Besides the stock (see stocks()), the chart changes with the weekly price history and
+    with its 12-week window; the pages are rendered when the price history needs an update.
+    """
+    if not conditional_get_enabled():
+        return None
+
+    history_date = PriceHistory.get_latest_date(stock.stock_symbol.upper())
+    if PriceHistory.is_outdated(history_date):
+        return None
+
+    summary = PortfolioSummary.for_user(current_user.id)
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    return make_etag(request.endpoint, stock.id, *summary.version, history_date, today, *version)
+
+@stocks_blueprint.route('/stocks/<id>')
+@login_required
+@read_only
+def stock_details(id):
+    stock = get_stock_of_current_user(id)
+
+    etag = stock_etag(stock)
+    if etag is not None:
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+    # The chart data is fetched from stock_chart_data(), so the page size does not grow with the history
+    title = f'Weekly Prices ({stock.stock_symbol})' if stock.has_weekly_stock_data() else ''
+    response = make_response(render_template('stocks/stock_details.html', stock=stock, title=title))
+    if etag is not None:
+        add_validators(response, etag)
+    return response
+
+@stocks_blueprint.route('/stocks/<id>/chart_data')
+@login_required
+@read_only
+def stock_chart_data(id):
+    """Weekly prices of a stock, downsampled to at most max_points points (up to STOCK_CHART_MAX_POINTS)."""
+    stock = get_stock_of_current_user(id)
+    max_points = request.args.get('max_points', default=current_app.config['STOCK_CHART_MAX_POINTS'], type=int)
+    max_points = min(max(max_points, 3), current_app.config['STOCK_CHART_MAX_POINTS'])
+
+    etag = stock_etag(stock, max_points)
+    if etag is not None:
+        response = not_modified(etag)
+        if response is not None:
+            return response
 
     title, labels, values = stock.get_weekly_stock_data()
-    return render_template('stocks/stock_details.html', stock=stock, title=title, labels=labels, values=values)
\ No newline at end of file
+    # Largest-Triangle-Three-Buckets keeps the shape of the chart with fewer points
+    indexes = lttb([label.timestamp() for label in labels], values, max_points)
+    response = jsonify(title=title,
+                       labels=[labels[index].strftime('%m/%d/%Y') for index in indexes],
+                       values=[values[index] for index in indexes])
+    if etag is not None:
+        add_validators(response, etag)
+    return response
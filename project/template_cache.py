@@ -0,0 +1,48 @@
+"""
+Compilation of the Jinja templates ahead of the requests.
+
+Jinja compiles a template the first time it is rendered by a worker, so right
+after a deploy the first requests of every gunicorn worker pay for compiling
+base.html and the templates of the blueprints.
+
+With TEMPLATE_BYTECODE_CACHE_DIR set, the compiled templates are stored in
+that directory and loaded from it by the other workers (and after a restart);
+a template is compiled again when its source changes.  The templates are
+compiled by 'flask precompile-templates', and by each worker when it starts
+with TEMPLATE_PRECOMPILE set.
+"""
+import os
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+
+def configure_template_cache(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE_DIR', None)
+    app.config.setdefault('TEMPLATE_PRECOMPILE', False)
+
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """Compile every template (into TEMPLATE_BYTECODE_CACHE_DIR, if set)"""
+        start = time.perf_counter()
+        count = precompile_templates(app)
+        click.echo(f'Compiled {count} templates in {(time.perf_counter() - start) * 1000:.0f} ms.')
+
+    if app.config['TEMPLATE_PRECOMPILE']:
+        count = precompile_templates(app)
+        app.logger.info(f'Precompiled {count} templates')
+
+
+def precompile_templates(app) -> int:
+    """Load every template of the application and its blueprints; returns the number of templates."""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        # Compiles the template (or loads it from the bytecode cache) and keeps it in the template cache
+        app.jinja_env.get_template(name)
+    return len(names)
@@ -2,9 +2,10 @@ from . import users_blueprint
 from flask import render_template, abort, flash, request, current_app, redirect, url_for, copy_current_request_context
 from .forms import RegistrationForm, LoginForm, EmailForm, PasswordForm, ChangePasswordForm
 from flask_login import login_user, current_user, login_required, logout_user
-from project.models import User
+from project.models import PortfolioSummary, User
 
 from project import db, mail
+from project.db_routing import read_only
 from flask_mail import Message
 
 from sqlalchemy.exc import IntegrityError
@@ -134,8 +135,11 @@ def logout():
 
 @users_blueprint.route('/profile')
 @login_required
+@read_only
 def user_profile():
-    return render_template('users/profile.html')
+    # The totals are read from the portfolio summary (a single row)
+    summary = PortfolioSummary.for_user(current_user.id)
+    return render_template('users/profile.html', summary=summary)
 
 def generate_confirmation_email(user_email):
     confirm_serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
@@ -0,0 +1,159 @@
+"""
+Benchmark of the queries on the stocks table, without and with its indexes.
+
+Seeds a scratch database with ~1M stocks, then times the portfolio list query
+(WHERE user_id = ? ORDER BY id) and the query of the lots holding a symbol
+(WHERE security_symbol = ?) and prints their query plans, first without the
+indexes and then with the indexes defined on the Stock model (the same ones
+created by the b7e2d4f91c08 and c4d8e2a6f153 migrations).
+
+Usage:
+    python scripts/benchmark_stock_indexes.py [--rows 1000000] [--database-url URL]
+
+The database must not already hold a stocks table: by default a temporary
+SQLite file is used.  Use a scratch PostgreSQL database to see the plans of
+the production database.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from project.models import Security, Stock, User  # noqa: E402
+
+BATCH_SIZE = 10000
+
+
+def seed(engine, rows: int, users: int, symbols: list):
+    with engine.begin() as conn:
+        for start in range(1, users + 1, BATCH_SIZE):
+            conn.execute(User.__table__.insert(),
+                         [{'id': user_id, 'name': f'User {user_id}', 'email': f'user{user_id}@example.com'}
+                          for user_id in range(start, min(start + BATCH_SIZE, users + 1))])
+
+        now = datetime.now()
+        conn.execute(Security.__table__.insert(),
+                     [{'symbol': symbol, 'current_price': round(random.uniform(1, 500), 2), 'current_price_date': now}
+                      for symbol in symbols])
+
+        for start in range(0, rows, BATCH_SIZE):
+            stocks = []
+            for _ in range(min(BATCH_SIZE, rows - start)):
+                symbol = random.choice(symbols)
+                stocks.append({'stock_symbol': symbol,
+                               'security_symbol': symbol,
+                               'number_of_shares': random.randint(1, 500),
+                               'purchase_price': round(random.uniform(1, 500), 2),
+                               'user_id': random.randint(1, users),
+                               'purchase_date': now})
+            conn.execute(Stock.__table__.insert(), stocks)
+
+
+def explain(conn, statement):
+    if conn.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif conn.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    else:
+        prefix = 'EXPLAIN '
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    return [' '.join(str(column) for column in row) for row in conn.exec_driver_sql(prefix + str(compiled))]
+
+
+def portfolio_query(user_id):
+    """Same query as Stock.get_portfolio()."""
+    stocks = Stock.__table__
+    securities = Security.__table__
+    position_value = sa.func.coalesce(securities.c.current_price, 0.0) * stocks.c.number_of_shares
+    return sa.select(stocks, securities.c.current_price, position_value) \
+             .join_from(stocks, securities, stocks.c.security_symbol == securities.c.symbol) \
+             .where(stocks.c.user_id == user_id) \
+             .order_by(stocks.c.id)
+
+
+def holders_query(symbol):
+    """Lots holding a symbol (e.g. to check if a security is still held)."""
+    stocks = Stock.__table__
+    return sa.select(sa.func.count()).select_from(stocks).where(stocks.c.security_symbol == symbol)
+
+
+def run_queries(engine, users: int, symbols: list, repeat: int):
+    portfolio = portfolio_query(sa.bindparam('user_id'))
+    holders = holders_query(sa.bindparam('symbol'))
+
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(portfolio, {'user_id': random.randint(1, users)}).fetchall()
+        portfolio_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        print(f'  portfolio list:    {portfolio_ms:8.2f} ms per query')
+        for line in explain(conn, portfolio_query(sa.literal(1))):
+            print(f'      {line}')
+
+        start = time.perf_counter()
+        for symbol in random.sample(symbols, repeat):
+            conn.execute(holders, {'symbol': symbol}).scalar()
+        holders_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        print(f'  holders of a symbol: {holders_ms:6.2f} ms per query')
+        for line in explain(conn, holders_query(sa.literal(symbols[0]))):
+            print(f'      {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='number of stocks to seed')
+    parser.add_argument('--users', type=int, default=20000, help='number of users holding the stocks')
+    parser.add_argument('--symbols', type=int, default=5000, help='number of distinct symbols')
+    parser.add_argument('--repeat', type=int, default=50, help='number of timed queries')
+    parser.add_argument('--database-url', help='scratch database (default: a temporary SQLite file)')
+    args = parser.parse_args()
+
+    temp_dir = None if args.database_url else tempfile.mkdtemp()
+    database_url = args.database_url or 'sqlite:///' + os.path.join(temp_dir, 'benchmark.db')
+    engine = sa.create_engine(database_url)
+    if sa.inspect(engine).has_table(Stock.__tablename__):
+        parser.error(f'{database_url} already has a {Stock.__tablename__} table, use a scratch database')
+
+    random.seed(0)
+    symbols = [f'S{i:04d}' for i in range(args.symbols)]
+    tables = [User.__table__, Security.__table__, Stock.__table__]
+    indexes = sorted(Stock.__table__.indexes, key=lambda index: index.name)
+    try:
+        User.__table__.metadata.create_all(engine, tables=tables)
+        for index in indexes:
+            index.drop(engine)
+
+        print(f'Seeding {args.rows} stocks in {database_url}...')
+        start = time.perf_counter()
+        seed(engine, args.rows, args.users, symbols)
+        print(f'  done in {time.perf_counter() - start:.1f} s')
+
+        print('\nWithout the indexes:')
+        run_queries(engine, args.users, symbols, args.repeat)
+
+        for index in indexes:
+            index.create(engine)
+        with engine.begin() as conn:
+            conn.execute(sa.text('ANALYZE'))
+
+        print(f'\nWith the indexes ({", ".join(index.name for index in indexes)}):')
+        run_queries(engine, args.users, symbols, args.repeat)
+    finally:
+        User.__table__.metadata.drop_all(engine, tables=tables)
+        engine.dispose()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
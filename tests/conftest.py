@@ -1,16 +1,32 @@
+import json
+import uuid
+from contextlib import contextmanager
+
 import pytest
 import requests
 from project import create_app, db
 from flask import current_app
+from sqlalchemy import event
 
-from project.models import Stock, User
+from project.models import PortfolioSummary, Stock, User
 from datetime import datetime
 
 ########################
 #### Helper Classes ####
 ########################
 
-class MockSuccessResponse(object):
+class MockResponse(object):
+    """Base class of the mocked responses, streaming the JSON data like requests.Response.iter_content()."""
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        content = json.dumps(self.json()).encode()
+        for index in range(0, len(content), chunk_size):
+            yield content[index:index + chunk_size]
+
+    def close(self):
+        pass
+
+
+class MockSuccessResponse(MockResponse):
     def __init__(self, url):
         self.status_code = 200
         self.url = url
@@ -34,7 +50,7 @@ class MockSuccessResponse(object):
 
 
 
-class MockFailedResponse(object):
+class MockFailedResponse(MockResponse):
     def __init__(self, url):
         self.status_code = 404
         self.url = url
@@ -43,7 +59,7 @@ class MockFailedResponse(object):
     def json(self):
         return {'error': 'bad'}
 
-class MockSuccessResponseDaily(object):
+class MockSuccessResponseDaily(MockResponse):
     def __init__(self, url):
         self.status_code = 200
         self.url = url
@@ -65,7 +81,7 @@ class MockSuccessResponseDaily(object):
         }
 
 
-class MockApiRateLimitExceededResponse(object):
+class MockApiRateLimitExceededResponse(MockResponse):
     def __init__(self, url):
         self.status_code = 200
         self.url = url
@@ -77,7 +93,7 @@ class MockApiRateLimitExceededResponse(object):
         }
 
 
-class MockFailedResponse(object):
+class MockFailedResponse(MockResponse):
     def __init__(self, url):
         self.status_code = 404
         self.url = url
@@ -86,7 +102,7 @@ class MockFailedResponse(object):
         return {'error': 'bad'}
 
 
-class MockSuccessResponseWeekly(object):
+class MockSuccessResponseWeekly(MockResponse):
     def __init__(self, url):
         self.status_code = 200
         self.url = url
@@ -141,6 +157,31 @@ def new_user():
     user = User('geisa@email.com', 'FlaskIsAwesome123')
     return user
 
+@pytest.fixture(scope='function')
+def create_users(test_client):
+    """
+    Return a function saving new users (called inside an application context) and returning their ids.
+
+    The users are deleted after the test, with any stock and portfolio summary left behind.
+    """
+    user_ids = []
+
+    def create(count=1):
+        users = [User('Test User', f'test.user.{uuid.uuid4().hex}@gmail.com', 'FlaskIsAwesome123')
+                 for _ in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids.extend(user.id for user in users)
+        return [user.id for user in users]
+
+    yield create
+
+    with test_client.application.app_context():
+        Stock.query.filter(Stock.user_id.in_(user_ids)).delete(synchronize_session=False)
+        PortfolioSummary.query.filter(PortfolioSummary.user_id.in_(user_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
 # to register a default user
 @pytest.fixture(scope='module')
 def register_default_user(test_client):
@@ -211,40 +252,72 @@ def add_stocks_for_default_user(test_client, log_in_default_user):
     'purchase_date': '2020-02-03'})
     return
 
-# ***fixtures for moking requests.get()***
+# ***fixtures for moking requests.Session.get() (used by the Alpha Vantage client)***
 @pytest.fixture(scope='function')
 def mock_requests_get_success_daily(monkeypatch):
-    # Create a mock for the requests.get() call to prevent making the actual API call
-    def mock_get(url):
+    # Create a mock for the requests.Session.get() call to prevent making the actual API call
+    def mock_get(self, url, **kwargs):
         return MockSuccessResponseDaily(url)
 
     url = 'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=MSFT&apikey=demo'
-    monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
 
 @pytest.fixture(scope='function')
 def mock_requests_get_api_rate_limit_exceeded(monkeypatch):
-    def mock_get(url):
+    def mock_get(self, url, **kwargs):
         return MockApiRateLimitExceededResponse(url)
 
     url = 'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=MSFT&apikey=demo'
-    monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
 
 @pytest.fixture(scope='function')
 def mock_requests_get_failure(monkeypatch):
-    def mock_get(url):
+    def mock_get(self, url, **kwargs):
         return MockFailedResponse(url)
 
     url = 'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=MSFT&apikey=demo'
-    monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
 
 @pytest.fixture(scope='function')
 def mock_requests_get_success_weekly(monkeypatch):
-    # Create a mock for the requests.get() call to prevent making the actual API call
-    def mock_get(url):
+    # Create a mock for the requests.Session.get() call to prevent making the actual API call
+    def mock_get(self, url, **kwargs):
         return MockSuccessResponseWeekly(url)
 
     url = 'https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY_ADJUSTED&symbol=MSFT&apikey=demo'
-    monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
+
+@pytest.fixture(scope='function')
+def api_calls(monkeypatch):
+    """Record the URLs passed to the mocked requests.Session.get() (list this fixture after the mock fixture)."""
+    calls = []
+    mock_get = requests.Session.get
+
+    def counting_mock_get(self, url, **kwargs):
+        calls.append(url)
+        return mock_get(self, url, **kwargs)
+
+    monkeypatch.setattr(requests.Session, 'get', counting_mock_get)
+    return calls
+
+# ***fixture for counting the SQL statements***
+@pytest.fixture(scope='function')
+def count_statements():
+    """Return a context manager recording the SQL statements executed by an engine inside its block."""
+    @contextmanager
+    def counting(engine):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+
+    return counting
 
 # ***register-login-logout 2nd user***
 @pytest.fixture(scope='module')
@@ -1,8 +1,12 @@
 """
 This file (test_stocks.py) contains the functional tests for the app.py file.
 """
+import re
+
 from app import app
 import requests
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
 
 from tests.conftest import *
 
@@ -225,4 +229,178 @@ def test_get_stock_detail_page_invalid_stock(test_client, log_in_default_user):
     """
     response = test_client.get('/stocks/234')
     assert response.status_code == 404
-    assert b'Stock Details' not in response.data
\ No newline at end of file
+    assert b'Stock Details' not in response.data
+
+
+# ***tests related to the refresh-prices command***
+def test_refresh_prices_command(test_client, add_stocks_for_default_user, mock_requests_get_success_daily):
+    """
+    GIVEN a Flask application configured for testing, with the default set of stocks in the database
+    WHEN the 'flask stocks refresh-prices' command is run
+    THEN check that the current price of every stock is updated
+    """
+    runner = test_client.application.test_cli_runner()
+    result = runner.invoke(args=['stocks', 'refresh-prices'])
+    assert result.exit_code == 0
+    assert 'Refreshed the prices of' in result.output
+
+    with test_client.application.app_context():
+        stocks = Stock.query.all()
+        assert len(stocks) > 0
+        for stock in stocks:
+            assert stock.current_price == 148.34
+            assert stock.current_price_date.date() == datetime.now().date()
+            assert stock.position_value == 148.34 * stock.number_of_shares
+
+def test_get_stock_detail_page_uses_price_history(test_client, add_stocks_for_default_user, mock_requests_get_success_weekly, monkeypatch, api_calls):
+    """
+    GIVEN a Flask application configured for testing, with the default user logged in
+    and the default set of stocks in the database (the mocked weekly data is from 2020,
+    so the price history is only considered up to date with a long refresh period)
+    WHEN the '/stocks/3' page is retrieved (GET) twice
+    THEN check that the second view reads the chart from the price history without calling Alpha Vantage
+    """
+    monkeypatch.setitem(test_client.application.config, 'PRICE_HISTORY_REFRESH_DAYS', 36500)
+
+    res = test_client.get('/stocks/3', follow_redirects=True)
+    assert res.status_code == 200
+    assert b'canvas id="stockChart"' in res.data
+    calls_after_first_view = len(api_calls)
+
+    res = test_client.get('/stocks/3', follow_redirects=True)
+    assert res.status_code == 200
+    assert b'canvas id="stockChart"' in res.data
+    assert len(api_calls) == calls_after_first_view
+
+def test_get_stock_list_totals_without_writes(test_client, add_stocks_for_default_user, mock_requests_get_success_daily):
+    """
+    GIVEN a Flask application configured for testing, with the default user logged in
+    and the prices of the default set of stocks refreshed
+    WHEN the '/stocks' page is requested (GET)
+    THEN check that the position values and the total value are displayed, without committing to the database
+    """
+    runner = test_client.application.test_cli_runner()
+    runner.invoke(args=['stocks', 'refresh-prices'])
+
+    commits = []
+
+    def count_commit(session):
+        commits.append(session)
+
+    event.listen(SignallingSession, 'after_commit', count_commit)
+    try:
+        res = test_client.get('/stocks', follow_redirects=True)
+    finally:
+        event.remove(SignallingSession, 'after_commit', count_commit)
+
+    assert res.status_code == 200
+    assert b'TOTAL VALUE' in res.data
+    assert b'$4005.18' in res.data    # 27 shares of SAM at $148.34
+    assert len(commits) == 0
+
+def test_get_stock_list_paginated(test_client, add_stocks_for_default_user, mock_requests_get_success_daily, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing with 2 stocks per page, with the default user logged in
+    and the default set of stocks in the database
+    WHEN the '/stocks' page and its next page are requested (GET)
+    THEN check that each page links to the next one by the last stock id and shows the total value of all the stocks
+    """
+    monkeypatch.setitem(test_client.application.config, 'STOCKS_PER_PAGE', 2)
+
+    res = test_client.get('/stocks/')
+    assert res.status_code == 200
+    assert res.data.count(b'<tr>') == 1 + 2 + 1    # header row, 2 stocks, footer row
+    assert b'Next page' in res.data
+    assert b'First page' not in res.data
+    after_id = int(re.search(rb'/stocks/\?after=(\d+)', res.data).group(1))
+    total = re.search(rb'<td><b>\$([\d,.]+)</b></td>', res.data).group(1)
+
+    res = test_client.get(f'/stocks/?after={after_id}')
+    assert res.status_code == 200
+    assert b'First page' in res.data
+    assert f'id={after_id}"'.encode() not in res.data
+    for stock_id in map(int, re.findall(rb'href="/stocks/(\d+)"', res.data)):
+        assert stock_id > after_id
+    assert re.search(rb'<td><b>\$([\d,.]+)</b></td>', res.data).group(1) == total
+
+def test_get_stock_list_streamed(test_client, add_stocks_for_default_user, mock_requests_get_success_daily, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing with the streamed rendering, with the default user logged in
+    and the default set of stocks in the database
+    WHEN the '/stocks' page is requested (GET)
+    THEN check that the response is streamed and each default stock is displayed
+    """
+    monkeypatch.setitem(test_client.application.config, 'STOCKS_STREAM_RENDERING', True)
+
+    res = test_client.get('/stocks/')
+    assert res.status_code == 200
+    assert res.is_streamed
+    data = res.get_data()
+    assert b'List of Stocks' in data
+    for element in [b'SAM', b'COST', b'TWTR', b'TOTAL VALUE']:
+        assert element in data
+
+def test_get_stock_list_not_modified(test_client, add_stocks_for_default_user, mock_requests_get_success_daily, count_statements):
+    """
+    GIVEN a Flask application configured for testing, with the default user logged in
+    and the default set of stocks in the database
+    WHEN the '/stocks' page is revalidated with its ETag (GET), before and after a new stock is added
+    THEN check that the unchanged page gets a 304 response without querying the stocks, and the changed page is rendered
+    """
+    test_client.get('/stocks/')    # displays the flashed messages of the added stocks
+    res = test_client.get('/stocks/')
+    assert res.status_code == 200
+    assert res.headers['ETag'].startswith('W/"')
+    assert 'Last-Modified' not in res.headers
+    assert 'private' in res.headers['Cache-Control']
+    etag = res.headers['ETag']
+
+    # The ETag is the only validator (the version can change within the second of a Last-Modified date)
+    res = test_client.get('/stocks/', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert res.status_code == 200
+
+    with test_client.application.app_context():
+        engine = db.engine
+    with count_statements(engine) as statements:
+        res = test_client.get('/stocks/', headers={'If-None-Match': etag})
+    assert res.status_code == 304
+    assert res.data == b''
+    assert res.headers['ETag'] == etag
+    assert not any('FROM stocks' in statement for statement in statements)
+
+    test_client.post('/add_stock', data={'stock_symbol': 'NFLX',
+                                         'number_of_shares': '3',
+                                         'purchase_price': '380.50',
+                                         'purchase_date': '2021-03-15'})
+    test_client.get('/stocks/')    # displays the flashed message of the added stock
+    res = test_client.get('/stocks/', headers={'If-None-Match': etag})
+    assert res.status_code == 200
+    assert b'NFLX' in res.data
+    assert res.headers['ETag'] != etag
+
+def test_get_stock_chart_data_downsampled(test_client, add_stocks_for_default_user, mock_requests_get_success_weekly, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing, with the default user logged in
+    and the default set of stocks in the database
+    WHEN the chart data of '/stocks/3' is retrieved (GET) in full and with max_points=3
+    THEN check that the page does not inline the prices and that the series is downsampled, keeping its first and last weeks
+    """
+    monkeypatch.setitem(test_client.application.config, 'PRICE_HISTORY_REFRESH_DAYS', 36500)
+
+    res = test_client.get('/stocks/3')
+    assert res.status_code == 200
+    assert b'/stocks/3/chart_data' in res.data
+
+    res = test_client.get('/stocks/3/chart_data')
+    assert res.status_code == 200
+    series = res.get_json()
+    assert series['title'].startswith('Weekly Prices (')
+    assert len(series['labels']) == len(series['values']) > 3
+
+    res = test_client.get('/stocks/3/chart_data?max_points=3')
+    assert res.status_code == 200
+    downsampled = res.get_json()
+    assert len(downsampled['labels']) == len(downsampled['values']) == 3
+    assert downsampled['labels'][0] == series['labels'][0]
+    assert downsampled['labels'][-1] == series['labels'][-1]
+    assert set(downsampled['values']) <= set(series['values'])
@@ -0,0 +1,149 @@
+"""
+This file (test_alpha_vantage.py) contains the unit tests for the alpha_vantage.py file.
+"""
+import json
+
+import pytest
+import requests
+
+from project import alpha_vantage
+from project.alpha_vantage import MissingTimeSeries, iter_time_series
+from tests.conftest import MockSuccessResponseDaily
+
+
+def split_into_chunks(data: dict, chunk_size: int):
+    content = json.dumps(data, indent=4).encode()
+    return [content[index:index + chunk_size] for index in range(0, len(content), chunk_size)]
+
+
+def test_alpha_vantage_client_reuses_session(test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the Alpha Vantage session is requested twice
+    THEN check that the same pooled session is returned
+    """
+    with test_client.application.app_context():
+        session = alpha_vantage.session
+        assert session is alpha_vantage.session
+
+        adapter = session.get_adapter('https://www.alphavantage.co/query')
+        assert adapter._pool_maxsize == test_client.application.config['ALPHA_VANTAGE_POOL_SIZE']
+        assert adapter.max_retries.connect == test_client.application.config['ALPHA_VANTAGE_MAX_RETRIES']
+        assert not adapter.max_retries.status_forcelist
+
+
+def test_alpha_vantage_client_get_uses_timeouts(test_client, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
+    WHEN a GET call is made with the Alpha Vantage client
+    THEN check that the connect and read timeouts are passed to the session
+    """
+    calls = []
+
+    def mock_get(self, url, **kwargs):
+        calls.append((url, kwargs))
+        return MockSuccessResponseDaily(url)
+
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
+
+    with test_client.application.app_context():
+        alpha_vantage.get('https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=MSFT&apikey=demo')
+        config = test_client.application.config
+        assert calls[0][1]['timeout'] == (config['ALPHA_VANTAGE_CONNECT_TIMEOUT'], config['ALPHA_VANTAGE_READ_TIMEOUT'])
+
+
+def test_alpha_vantage_client_get_retries_through_the_rate_limiter(test_client, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
+    WHEN a GET call gets a 503 response and then a 200 response, and another call gets a 429 response
+    THEN check that the 503 is retried with a new token, and that the 429 is not retried but drains the rate limiter
+    """
+    statuses = [503, 200, 429]
+    tokens = []
+    drained = []
+
+    class MockResponse(object):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+        def close(self):
+            pass
+
+    def mock_get(self, url, **kwargs):
+        return MockResponse(statuses.pop(0))
+
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
+    monkeypatch.setitem(test_client.application.config, 'ALPHA_VANTAGE_BACKOFF_FACTOR', 0)
+
+    with test_client.application.app_context():
+        acquire = alpha_vantage.scheduler.acquire
+
+        def counting_acquire(*args, **kwargs):
+            tokens.append(args)
+            return acquire(*args, **kwargs)
+
+        monkeypatch.setattr(alpha_vantage.scheduler, 'acquire', counting_acquire)
+        monkeypatch.setattr(alpha_vantage.scheduler.limiter, 'drain', lambda: drained.append(True))
+
+        url = 'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=MSFT&apikey=demo'
+        assert alpha_vantage.get(url).status_code == 200
+        assert len(tokens) == 2
+
+        assert alpha_vantage.get(url).status_code == 429
+        assert len(tokens) == 3
+        assert drained == [True]
+
+
+def test_iter_time_series():
+    """
+    GIVEN a daily time series response split into small chunks
+    WHEN the response is parsed with iter_time_series()
+    THEN check that the dates and fields are returned in order
+    """
+    data = {
+        'Meta Data': {'1. Information': 'Daily Prices (open, high, low, close) and Volumes'},
+        'Time Series (Daily)': {
+            '2022-02-10': {'4. close': '302.3800'},
+            '2022-02-09': {'4. close': '301.9800'},
+            '2022-02-08': {'4. close': '300.2200'}
+        }
+    }
+    for chunk_size in (1, 7, 4096):
+        series = list(iter_time_series(split_into_chunks(data, chunk_size), 'Time Series (Daily)'))
+        assert series == [('2022-02-10', {'4. close': '302.3800'}),
+                          ('2022-02-09', {'4. close': '301.9800'}),
+                          ('2022-02-08', {'4. close': '300.2200'})]
+
+
+def test_iter_time_series_early_exit():
+    """
+    GIVEN a weekly time series response with many weeks
+    WHEN only the latest week is read from iter_time_series()
+    THEN check that the rest of the response is not read
+    """
+    data = {'Weekly Adjusted Time Series': {f'{year}-01-03': {'4. close': '100.0'} for year in range(2020, 1990, -1)}}
+    chunks = split_into_chunks(data, 64)
+    consumed = []
+
+    def chunk_iterator():
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+
+    for date, fields in iter_time_series(chunk_iterator(), 'Weekly Adjusted Time Series'):
+        assert date == '2020-01-03'
+        break
+
+    assert len(consumed) < len(chunks) / 4
+
+
+def test_iter_time_series_missing_key():
+    """
+    GIVEN a response sent when the API rate limit has been exceeded
+    WHEN the response is parsed with iter_time_series()
+    THEN check that MissingTimeSeries is raised with the decoded response
+    """
+    data = {'Note': 'Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute.'}
+    with pytest.raises(MissingTimeSeries) as excinfo:
+        list(iter_time_series(split_into_chunks(data, 10), 'Time Series (Daily)'))
+    assert 'Note' in excinfo.value.payload
@@ -0,0 +1,82 @@
+"""
+This file (test_cache.py) contains the unit tests for the cache.py file.
+"""
+from project.cache import MemoryCache, SQLiteCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_cache_get_set():
+    """
+    GIVEN a MemoryCache
+    WHEN a value is stored
+    THEN check the value is returned until it expires
+    """
+    timer = FakeTimer()
+    cache = MemoryCache(ttl=60, max_entries=10, timer=timer)
+    cache.set('AAPL', 148.34)
+    assert cache.get('AAPL') == 148.34
+    assert cache.get('MSFT') is None
+
+    timer.now += 61
+    assert cache.get('AAPL') is None
+    assert len(cache) == 0
+
+
+def test_memory_cache_lru_eviction():
+    """
+    GIVEN a MemoryCache limited to two entries
+    WHEN a third value is stored
+    THEN check the least recently used entry is evicted
+    """
+    cache = MemoryCache(ttl=60, max_entries=2)
+    cache.set('AAPL', 148.34)
+    cache.set('MSFT', 302.38)
+    assert cache.get('AAPL') == 148.34
+    cache.set('COST', 512.10)
+    assert cache.get('MSFT') is None
+    assert cache.get('AAPL') == 148.34
+    assert cache.get('COST') == 512.10
+
+
+def test_sqlite_cache_shared_between_instances(tmp_path):
+    """
+    GIVEN two SQLiteCache objects using the same file (like two gunicorn workers)
+    WHEN a value is stored with the first cache
+    THEN check the value is returned by the second cache until it expires
+    """
+    timer = FakeTimer()
+    path = str(tmp_path / 'quote_cache.sqlite')
+    cache1 = SQLiteCache(path, ttl=60, max_entries=10, timer=timer)
+    cache2 = SQLiteCache(path, ttl=60, max_entries=10, timer=timer)
+    cache1.set('AAPL', 148.34)
+    assert cache2.get('AAPL') == 148.34
+
+    timer.now += 61
+    assert cache2.get('AAPL') is None
+
+
+def test_sqlite_cache_lru_eviction(tmp_path):
+    """
+    GIVEN a SQLiteCache limited to two entries
+    WHEN a third value is stored
+    THEN check the least recently used entry is evicted
+    """
+    timer = FakeTimer()
+    cache = SQLiteCache(str(tmp_path / 'quote_cache.sqlite'), ttl=60, max_entries=2, timer=timer)
+    cache.set('AAPL', 148.34)
+    timer.now += 1
+    cache.set('MSFT', 302.38)
+    timer.now += 1
+    assert cache.get('AAPL') == 148.34
+    timer.now += 1
+    cache.set('COST', 512.10)
+    assert len(cache) == 2
+    assert cache.get('MSFT') is None
+    assert cache.get('AAPL') == 148.34
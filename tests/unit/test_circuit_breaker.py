@@ -0,0 +1,70 @@
+"""
+This file (test_circuit_breaker.py) contains the unit tests for the circuit_breaker.py file.
+"""
+from project.circuit_breaker import CircuitBreaker, SymbolBackoff
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_opens_after_failures():
+    """
+    GIVEN a CircuitBreaker opening after 3 consecutive failures
+    WHEN 3 calls fail
+    THEN check that no call is allowed until the reset timeout, then only a single trial call
+    """
+    timer = FakeTimer()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60, timer=timer)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    timer.now += 60
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_circuit_breaker_failed_trial_reopens():
+    """
+    GIVEN an open CircuitBreaker
+    WHEN the trial call made after the reset timeout fails
+    THEN check that the breaker opens again
+    """
+    timer = FakeTimer()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, timer=timer)
+    breaker.record_failure()
+    timer.now += 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_symbol_backoff_is_exponential():
+    """
+    GIVEN a SymbolBackoff starting at 60 seconds
+    WHEN a symbol fails three times in a row
+    THEN check that the symbol is blocked for 60, 120 and 240 seconds, until it succeeds
+    """
+    timer = FakeTimer()
+    backoff = SymbolBackoff(base_delay=60, max_delay=3600, timer=timer)
+    assert not backoff.is_blocked('INVALID')
+    assert backoff.record_failure('INVALID') == 60
+    assert backoff.is_blocked('invalid')
+    assert backoff.record_failure('INVALID') == 120
+    assert backoff.record_failure('INVALID') == 240
+
+    timer.now += 240
+    assert not backoff.is_blocked('INVALID')
+    backoff.record_success('INVALID')
+    assert backoff.record_failure('INVALID') == 60
@@ -0,0 +1,98 @@
+"""
+This file (test_compression.py) contains the unit tests for the compression.py file.
+"""
+import gzip
+
+from flask import Flask, Response, jsonify, stream_with_context
+
+from project.compression import configure_compression
+
+ROWS = ''.join(f'<tr><td>AAPL</td><td>{shares}</td><td>$148.34</td></tr>' for shares in range(500))
+
+
+def create_test_app(**config):
+    app = Flask(__name__)
+    app.config['COMPRESSION_ENABLED'] = True
+    app.config.update(config)
+    configure_compression(app)
+
+    @app.route('/portfolio')
+    def portfolio():
+        return f'<table>{ROWS}</table>'
+
+    @app.route('/small')
+    def small():
+        return '<p>Kozuki-IO</p>'
+
+    @app.route('/chart_data')
+    def chart_data():
+        return jsonify(values=[148.34] * 500)
+
+    @app.route('/style.css')
+    def style():
+        return Response('body { color: black; }\n' * 100, mimetype='text/css')
+
+    @app.route('/streamed')
+    def streamed():
+        def generate():
+            yield '<table>'
+            for row in range(5):
+                yield ROWS
+            yield '</table>'
+        return Response(stream_with_context(generate()), mimetype='text/html')
+
+    return app
+
+
+def test_compress_html_and_json():
+    """
+    GIVEN a Flask application with the compression enabled
+    WHEN large HTML and JSON responses are requested by a browser accepting gzip
+    THEN check that they are gzip-compressed, many times smaller than the original response
+    """
+    client = create_test_app().test_client()
+
+    res = client.get('/portfolio', headers={'Accept-Encoding': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in res.headers['Vary']
+    assert gzip.decompress(res.data).decode() == f'<table>{ROWS}</table>'
+    assert int(res.headers['Content-Length']) * 10 < len(ROWS)
+
+    res = client.get('/chart_data', headers={'Accept-Encoding': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert b'148.34' in gzip.decompress(res.data)
+
+
+def test_compression_skipped():
+    """
+    GIVEN a Flask application with the compression enabled
+    WHEN responses below the size threshold, of another mimetype, or requested without Accept-Encoding are returned
+    THEN check that they are sent uncompressed
+    """
+    client = create_test_app(COMPRESSION_MIN_SIZE=100).test_client()
+
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/style.css', headers={'Accept-Encoding': 'gzip'}).headers
+    res = client.get('/portfolio')
+    assert 'Content-Encoding' not in res.headers
+    assert res.data.decode() == f'<table>{ROWS}</table>'
+
+    app = create_test_app(COMPRESSION_ENABLED=False)
+    assert 'Content-Encoding' not in app.test_client().get('/portfolio', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_compress_streamed_response():
+    """
+    GIVEN a Flask application with the compression enabled
+    WHEN a streamed HTML response is requested by a browser accepting gzip
+    THEN check that each chunk is compressed (and flushed) as it is streamed and the whole stream decompresses to the page
+    """
+    client = create_test_app().test_client()
+
+    res = client.get('/streamed', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert res.is_streamed
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in res.headers
+    chunks = list(res.response)
+    assert len(chunks) > 2
+    assert gzip.decompress(b''.join(chunks)).decode() == '<table>' + ROWS * 5 + '</table>'
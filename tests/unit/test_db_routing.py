@@ -0,0 +1,98 @@
+"""
+This file (test_db_routing.py) contains the unit tests for the db_routing.py file.
+"""
+from datetime import datetime
+
+import pytest
+from flask import session as flask_session
+from flask_sqlalchemy import get_state
+
+from project import db
+from project.db_routing import REPLICA_BIND, read_only, replica_reads
+from project.models import Security, Stock, User
+
+
+@pytest.fixture(scope='function')
+def replica(test_client, tmp_path, monkeypatch, create_users):
+    # A second SQLite file plays the read replica, holding a stock (of a user of the primary) missing from the primary
+    app = test_client.application
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', {REPLICA_BIND: f'sqlite:///{tmp_path / "replica.db"}'})
+    with app.app_context():
+        user_id, = create_users()
+        user = User.query.get(user_id)
+        engine = db.get_engine(app, bind=REPLICA_BIND)
+        db.Model.metadata.create_all(engine, tables=[User.__table__, Security.__table__, Stock.__table__])
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), {'id': user_id, 'name': user.name, 'email': user.email,
+                                                   'password_hashed': user.password_hashed})
+            conn.execute(Security.__table__.insert(), {'symbol': 'REPLICA'})
+            conn.execute(Stock.__table__.insert(), {'stock_symbol': 'REPLICA', 'number_of_shares': 1,
+                                                    'purchase_price': 1.0, 'user_id': user_id,
+                                                    'security_symbol': 'REPLICA'})
+    yield user_id
+    get_state(app).connectors.pop(REPLICA_BIND).get_engine().dispose()
+
+
+def replica_stocks(user_id):
+    return Stock.query.filter_by(user_id=user_id).count()
+
+
+def test_read_only_view_reads_from_replica(test_client, replica):
+    """
+    GIVEN a Flask application with a read replica configured
+    WHEN stocks are queried inside and outside a read-only view
+    THEN check that only the queries of the read-only view go to the replica
+    """
+    with test_client.application.test_request_context():
+        assert replica_stocks(replica) == 0
+        assert read_only(replica_stocks)(replica) == 1
+        with replica_reads():
+            assert replica_stocks(replica) == 1
+
+    with test_client.application.app_context():
+        assert replica_stocks(replica) == 0
+
+
+def test_reads_go_to_primary_after_a_write(test_client, replica, create_users):
+    """
+    GIVEN a Flask application with a read replica configured
+    WHEN a user commits a change during a read-only view
+    THEN check that the next queries of the request and of the user's later requests go to the primary
+    """
+    with test_client.application.app_context():
+        other_user_id, = create_users()
+
+    with test_client.application.test_request_context():
+        db.session.info['replica_reads'] = True
+        assert replica_stocks(replica) == 1
+
+        stock = Stock('PRIMARY', '1', '1.0', other_user_id, datetime(2022, 2, 12))
+        db.session.add(stock)
+        db.session.commit()
+        assert replica_stocks(replica) == 0
+        primary_until = flask_session['db_primary_until']
+
+        db.session.delete(stock)
+        db.session.commit()
+        db.session.remove()
+
+    with test_client.application.test_request_context():
+        flask_session['db_primary_until'] = primary_until
+        db.session.info['replica_reads'] = True
+        assert replica_stocks(replica) == 0
+        db.session.remove()
+
+
+def test_replica_not_configured(test_client, create_users):
+    """
+    GIVEN a Flask application without a read replica
+    WHEN stocks are queried in a read-only view
+    THEN check that the queries go to the primary
+    """
+    with test_client.application.app_context():
+        user_id, = create_users()
+        db.session.add(Stock('PRIMARY', '1', '1.0', user_id, datetime(2022, 2, 12)))
+        db.session.commit()
+
+    with test_client.application.test_request_context():
+        assert read_only(replica_stocks)(user_id) == 1
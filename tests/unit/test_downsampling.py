@@ -0,0 +1,34 @@
+"""
+This file (test_downsampling.py) contains the unit tests for the downsampling.py file.
+"""
+import math
+
+from project.downsampling import lttb
+
+
+def test_lttb_short_series_unchanged():
+    """
+    GIVEN a series with fewer points than the threshold
+    WHEN it is downsampled
+    THEN check that every point is kept
+    """
+    assert lttb([1, 2, 3], [10.0, 12.0, 11.0], 5) == [0, 1, 2]
+    assert lttb([], [], 5) == []
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    """
+    GIVEN a long series with a single spike
+    WHEN it is downsampled to a few points
+    THEN check that the first and last points and the spike are kept, in order
+    """
+    xs = list(range(1000))
+    ys = [math.sin(x / 50) for x in xs]
+    ys[637] = 10.0
+
+    indexes = lttb(xs, ys, 20)
+    assert len(indexes) == 20
+    assert indexes[0] == 0
+    assert indexes[-1] == 999
+    assert 637 in indexes
+    assert indexes == sorted(set(indexes))
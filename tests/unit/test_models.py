@@ -1,10 +1,17 @@
 """
 This file (test_models.py) contains the unit tests for the models.py file.
 """
+import time
 from datetime import datetime
 
 from freezegun import freeze_time
 
+
+from project import alpha_vantage, db
+from project.cache import MemoryCache
+from project.circuit_breaker import SymbolBackoff
+from project.models import PortfolioSummary, Security, Stock, User, get_cached_stock_price, get_current_stock_price
+
 def test_new_stock(new_stock):
     """
     GIVEN a Stock model
@@ -44,7 +51,7 @@ def test_set_password(new_user):
 # this test uses the mock_requests_get_success_daily fixture to mimic a successful response from Alpha Vantage
 def test_get_stock_data_success(new_stock, mock_requests_get_success_daily):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to successful
     THEN check that the stock data is updated
     """
@@ -59,7 +66,7 @@ def test_get_stock_data_success(new_stock, mock_requests_get_success_daily):
 
 def test_get_stock_data_api_rate_limit_exceeded(new_stock, mock_requests_get_api_rate_limit_exceeded):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to successful but the API rate limit is exceeded
     THEN check that the stock data is not updated
     """
@@ -74,7 +81,7 @@ def test_get_stock_data_api_rate_limit_exceeded(new_stock, mock_requests_get_api
 
 def test_get_stock_data_failure(new_stock, mock_requests_get_failure):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to failed
     THEN check that the stock data is not updated
     """
@@ -89,7 +96,7 @@ def test_get_stock_data_failure(new_stock, mock_requests_get_failure):
 
 def test_get_stock_data_success_two_calls(new_stock, mock_requests_get_success_daily):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to successful
     THEN check that the stock data is updated
     """
@@ -109,7 +116,7 @@ def test_get_stock_data_success_two_calls(new_stock, mock_requests_get_success_d
 @freeze_time('2020-07-28')
 def test_get_weekly_stock_data_success(new_stock, mock_requests_get_success_weekly):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to successful
     THEN check the HTTP response
     """
@@ -120,18 +127,241 @@ def test_get_weekly_stock_data_success(new_stock, mock_requests_get_success_week
     assert labels[1].date() == datetime(2020, 7, 17).date()
     assert labels[2].date() == datetime(2020, 7, 24).date()
     assert len(values) == 3
-    assert values[0] == '354.3400'
-    assert values[1] == '362.7600'
-    assert values[2] == '379.2400'
+    assert values[0] == 354.34
+    assert values[1] == 362.76
+    assert values[2] == 379.24
     assert datetime.now() == datetime(2020, 7, 28)
 
 def test_get_weekly_stock_data_failure(new_stock, mock_requests_get_failure):
     """
-    GIVEN a Flask application configured for testing and a monkeypatched version of requests.get()
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
     WHEN the HTTP response is set to failed
     THEN check the HTTP response
     """
     title, labels, values = new_stock.get_weekly_stock_data()
     assert title == ''
     assert len(labels) == 0
-    assert len(values) == 0
\ No newline at end of file
+    assert len(values) == 0
+
+
+def test_get_cached_stock_price(test_client, mock_requests_get_success_daily, monkeypatch, api_calls):
+    """
+    GIVEN a Flask application with an in-memory quote cache and a monkeypatched version of requests.Session.get()
+    WHEN the price of the same symbol is requested twice
+    THEN check that Alpha Vantage is only called once
+    """
+    with test_client.application.app_context():
+        monkeypatch.setitem(test_client.application.extensions, 'quote_cache', MemoryCache())
+        assert get_cached_stock_price('AAPL') == 148.34
+        assert get_cached_stock_price('aapl') == 148.34
+        assert len(api_calls) == 1
+
+
+def test_get_cached_stock_price_expires_at_midnight(test_client, mock_requests_get_success_daily, monkeypatch, api_calls):
+    """
+    GIVEN a Flask application with an in-memory quote cache and a monkeypatched version of requests.Session.get()
+    WHEN the price of a symbol is cached a few minutes before midnight and requested again after midnight
+    THEN check that Alpha Vantage is called again, instead of serving the price of the previous day
+    """
+    with test_client.application.app_context():
+        with freeze_time('2022-03-01 23:55:00') as frozen_time:
+            monkeypatch.setitem(test_client.application.extensions, 'quote_cache', MemoryCache(timer=lambda: time.time()))
+            assert get_cached_stock_price('AAPL') == 148.34
+            frozen_time.tick(60)
+            assert get_cached_stock_price('AAPL') == 148.34
+            assert len(api_calls) == 1
+
+            frozen_time.tick(5 * 60)
+            assert get_cached_stock_price('AAPL') == 148.34
+            assert len(api_calls) == 2
+
+def test_get_current_stock_price_backs_off_failing_symbol(test_client, mock_requests_get_failure, monkeypatch, api_calls):
+    """
+    GIVEN a Flask application with the symbol backoff enabled and a monkeypatched version of requests.Session.get()
+    WHEN the HTTP response is set to failed and the price of the same symbol is requested twice
+    THEN check that Alpha Vantage is only called once
+    """
+    with test_client.application.app_context():
+        alpha_vantage.session  # create the per-process objects before replacing the symbol backoff
+        monkeypatch.setattr(alpha_vantage, '_symbol_backoff', SymbolBackoff(base_delay=60))
+        assert get_current_stock_price('INVALID') == 0.0
+        assert get_current_stock_price('INVALID') == 0.0
+        assert len(api_calls) == 1
+
+def test_load_user_from_user_cache(test_client, monkeypatch, count_statements):
+    """
+    GIVEN a Flask application with an in-memory user cache and a user in the database
+    WHEN the user is loaded twice, then its password is changed and it is loaded again
+    THEN check that the second load does not query the database and that the change invalidates the cache
+    """
+    with test_client.application.app_context():
+        cache = MemoryCache()
+        monkeypatch.setitem(test_client.application.extensions, 'user_cache', cache)
+        user = User('Cached User', 'cached.user@gmail.com', 'FlaskIsAwesome123')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.remove()
+
+        assert User.load(user_id).email == 'cached.user@gmail.com'
+        db.session.remove()
+
+        with count_statements(db.engine) as statements:
+            cached_user = User.load(user_id)
+        assert statements == []
+        assert cached_user.email == 'cached.user@gmail.com'
+        assert cached_user.is_password_correct('FlaskIsAwesome123')
+
+        cached_user.set_password('FlaskIsStillAwesome456')
+        db.session.commit()
+        assert cache.get(f'user:{user_id}') is None
+        db.session.remove()
+
+        assert User.load(user_id).is_password_correct('FlaskIsStillAwesome456')
+
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
+
+def test_stocks_share_the_security_of_their_symbol(test_client, create_users):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN stocks of the same symbol (in any case) are saved and the price of one of them is set
+    THEN check that they share a single security, so every lot holding the symbol has the new price
+    """
+    with test_client.application.app_context():
+        user_ids = create_users(3)
+        stocks = [Stock('nvda', '5', '120.50', user_ids[0], datetime(2022, 2, 12)),
+                  Stock('NVDA', '10', '131.00', user_ids[1], datetime(2022, 3, 1))]
+        db.session.add_all(stocks)
+        db.session.commit()
+
+        stock = Stock('Nvda ', '2', '140.00', user_ids[2], datetime(2022, 4, 5))
+        db.session.add(stock)
+        db.session.commit()
+
+        assert Security.query.filter_by(symbol='NVDA').count() == 1
+        assert stocks[0].security is stocks[1].security is stock.security
+
+        stock.set_current_price(150.0)
+        db.session.commit()
+        db.session.expire_all()
+        for holder in Stock.query.filter_by(security_symbol='NVDA').all():
+            assert holder.current_price == 150.0
+            assert holder.position_value == 150.0 * holder.number_of_shares
+
+        for holder in stocks + [stock]:
+            db.session.delete(holder)
+        db.session.commit()
+
+def test_new_symbol_added_concurrently(test_client, create_users):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN a stock of a new symbol is saved while another process saves the security of that symbol
+    THEN check that the stock is attached to the security saved by the other process
+    """
+    def insert_security(conn, cursor, statement, parameters, context, executemany):
+        # The other process commits the security right after this session found it missing
+        if 'FROM securities' in statement and not inserted:
+            inserted.append(True)
+            with other_engine.begin() as other_conn:
+                other_conn.execute(Security.__table__.insert(), {'symbol': 'ARM', 'current_price': 55.0})
+
+    inserted = []
+    with test_client.application.app_context():
+        user_id, = create_users()
+        other_engine = db.create_engine(db.engine.url, {})
+        db.event.listen(db.engine, 'after_cursor_execute', insert_security)
+        try:
+            stock = Stock('ARM', '3', '51.00', user_id, datetime(2022, 4, 5))
+            db.session.add(stock)
+            db.session.commit()
+        finally:
+            db.event.remove(db.engine, 'after_cursor_execute', insert_security)
+            other_engine.dispose()
+
+        assert inserted
+        assert Security.query.filter_by(symbol='ARM').count() == 1
+        assert stock.current_price == 55.0
+
+        db.session.delete(stock)
+        db.session.delete(Security.query.get('ARM'))
+        db.session.commit()
+
+def test_portfolio_summary_kept_up_to_date(test_client, create_users):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN stocks of a user are added, their prices change (one by one and in bulk) and a stock is deleted
+    THEN check that the portfolio summary of the user is kept equal to the totals of their stocks
+    """
+    def summary_of(user_id):
+        db.session.expire_all()
+        summary = PortfolioSummary.for_user(user_id)
+        return summary.lot_count, round(summary.cost_basis, 2), round(summary.total_value, 2)
+
+    with test_client.application.app_context():
+        first_user_id, second_user_id = create_users(2)
+        stocks = [Stock('AMD', '10', '100.00', first_user_id, datetime(2022, 2, 12)),
+                  Stock('AMD', '5', '110.00', second_user_id, datetime(2022, 3, 1)),
+                  Stock('QCOM', '2', '150.00', first_user_id, datetime(2022, 4, 5))]
+        db.session.add_all(stocks)
+        db.session.commit()
+        assert summary_of(first_user_id) == (2, 1300.0, 0.0)
+        assert summary_of(second_user_id) == (1, 550.0, 0.0)
+
+        stocks[0].set_current_price(120.0)
+        db.session.commit()
+        assert summary_of(first_user_id) == (2, 1300.0, 1200.0)
+        assert summary_of(second_user_id) == (1, 550.0, 600.0)
+
+        Security.bulk_update_prices({'AMD': 125.0, 'QCOM': 160.0})
+        db.session.commit()
+        assert summary_of(first_user_id) == (2, 1300.0, 1250.0 + 320.0)
+        assert summary_of(second_user_id) == (1, 550.0, 625.0)
+
+        db.session.delete(stocks[2])
+        db.session.commit()
+        assert summary_of(first_user_id) == (1, 1000.0, 1250.0)
+
+        PortfolioSummary.rebuild(db.session.connection(), [first_user_id, second_user_id])
+        db.session.commit()
+        assert summary_of(first_user_id) == (1, 1000.0, 1250.0)
+        assert summary_of(second_user_id) == (1, 550.0, 625.0)
+
+        for stock in stocks[:2]:
+            db.session.delete(stock)
+        db.session.commit()
+        assert summary_of(first_user_id) == (0, 0.0, 0.0)
+
+        PortfolioSummary.rebuild(db.session.connection(), [first_user_id])
+        db.session.commit()
+        assert summary_of(first_user_id) == (0, 0.0, 0.0)
+
+        Security.query.filter(Security.symbol.in_(['AMD', 'QCOM'])).delete(synchronize_session=False)
+        db.session.commit()
+
+def test_portfolio_loaded_in_one_query(test_client, create_users, count_statements):
+    """
+    GIVEN a Flask application configured for testing and a user holding several stocks of the same symbols
+    WHEN the portfolio of the user is loaded and the prices of its stocks are read
+    THEN check that the stocks and their securities are loaded in a single query
+    """
+    with test_client.application.app_context():
+        user_id, = create_users()
+        stocks = [Stock('INTC', '10', '45.00', user_id, datetime(2022, 2, 12)),
+                  Stock('TXN', '3', '170.00', user_id, datetime(2022, 3, 1)),
+                  Stock('INTC', '4', '50.00', user_id, datetime(2022, 4, 5))]
+        db.session.add_all(stocks)
+        db.session.commit()
+        db.session.remove()
+
+        with count_statements(db.engine) as statements:
+            portfolio = [(stock.stock_symbol, stock.number_of_shares, stock.current_price)
+                         for stock, _ in Stock.get_portfolio(user_id).all()]
+        assert len(statements) == 1
+        assert portfolio == [('INTC', 10, 0.0), ('TXN', 3, 0.0), ('INTC', 4, 0.0)]
+
+        for stock, _ in Stock.get_portfolio(user_id).all():
+            db.session.delete(stock)
+        db.session.commit()
+        Security.query.filter(Security.symbol.in_(['INTC', 'TXN'])).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,85 @@
+"""
+This file (test_pool_metrics.py) contains the unit tests for the pool_metrics.py file.
+"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from config import database_engine_options
+from project.pool_metrics import get_pool_metrics, instrument_engine
+
+
+@pytest.fixture(scope='function')
+def pool_engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.db"}', poolclass=QueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.2,
+                           connect_args={'check_same_thread': False})
+    yield instrument_engine(engine)
+    engine.dispose()
+
+
+def test_instrumented_engine_records_checkouts(pool_engine):
+    """
+    GIVEN an instrumented engine with a pool of a single connection
+    WHEN a second connection is checked out while the first one is held by another thread
+    THEN check that the checkouts, the wait, the opened connections and the peak of active connections are recorded
+    """
+    checked_out = threading.Event()
+
+    def hold_connection():
+        with pool_engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            checked_out.set()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=hold_connection)
+    thread.start()
+    checked_out.wait()
+    with pool_engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    thread.join()
+
+    metrics = get_pool_metrics(pool_engine).snapshot()
+    assert metrics['checkouts'] == 2
+    assert metrics['timeouts'] == 0
+    assert metrics['max_wait'] >= 0.05
+    assert metrics['active'] == 0
+    assert metrics['peak_active'] == 1
+    assert metrics['connections_opened'] == 1
+
+
+def test_instrumented_engine_records_timeouts(pool_engine):
+    """
+    GIVEN an instrumented engine with a pool of a single connection and a timeout of 0.2 seconds
+    WHEN a second connection is checked out while the first one is held
+    THEN check that the checkout times out and the timeout is recorded
+    """
+    with pool_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            pool_engine.connect()
+
+    metrics = get_pool_metrics(pool_engine).snapshot()
+    assert metrics['timeouts'] == 1
+    assert metrics['max_wait'] >= 0.2
+
+
+def test_database_engine_options(monkeypatch):
+    """
+    GIVEN the database engine options read from the environment
+    WHEN they are created for a SQLite and a PostgreSQL database
+    THEN check that only PostgreSQL gets the pool options and the statement timeout
+    """
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '20')
+    monkeypatch.setenv('DATABASE_STATEMENT_TIMEOUT', '5000')
+
+    assert database_engine_options('sqlite:////tmp/test.db') == {}
+
+    options = database_engine_options('postgresql://localhost/stocks')
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 10
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
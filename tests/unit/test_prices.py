@@ -0,0 +1,102 @@
+"""
+This file (test_prices.py) contains the unit tests for the prices.py file.
+"""
+from datetime import datetime, timedelta
+
+from project import db
+from project.models import Stock
+from project.prices import refresh_stock_prices, revalidate_stock_prices, update_stored_stock_prices
+
+
+def test_refresh_stock_prices_deduplicates_symbols(test_client, mock_requests_get_success_daily, api_calls):
+    """
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
+    WHEN the prices of four lots holding two distinct symbols are refreshed
+    THEN check that Alpha Vantage is called once per symbol and every lot is updated
+    """
+    stocks = [Stock('AAPL', '16', '406.78', 7, datetime(2022, 2, 12)),
+              Stock('AAPL', '4', '398.12', 8, datetime(2021, 5, 3)),
+              Stock('aapl', '10', '151.00', 9, datetime(2020, 1, 6)),
+              Stock('MSFT', '2', '302.38', 7, datetime(2022, 2, 10))]
+
+    with test_client.application.app_context():
+        prices = refresh_stock_prices(stocks, max_workers=4)
+
+    assert len(api_calls) == 2
+    assert prices == {'AAPL': 148.34, 'MSFT': 148.34}
+    for stock in stocks:
+        assert stock.current_price == 148.34
+        assert stock.current_price_date.date() == datetime.now().date()
+        assert stock.position_value == 148.34 * stock.number_of_shares
+
+
+def test_refresh_stock_prices_skips_fresh_stocks(test_client, mock_requests_get_failure):
+    """
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
+    WHEN the prices of stocks that were already updated today are refreshed
+    THEN check that no call is made and the prices are unchanged
+    """
+    stock = Stock('AAPL', '16', '406.78', 7, datetime(2022, 2, 12))
+    stock.current_price = 150.0
+    stock.current_price_date = datetime.now()
+
+    with test_client.application.app_context():
+        assert refresh_stock_prices([stock]) == {}
+
+    assert stock.current_price == 150.0
+
+
+def test_revalidate_stock_prices(test_client, mock_requests_get_success_daily, monkeypatch):
+    """
+    GIVEN a Flask application configured for testing and a monkeypatched version of requests.Session.get()
+    WHEN the prices of a stock priced yesterday and of a stock never priced are revalidated
+    THEN check that only the stock never priced is refreshed right away, and the other one in the background
+    """
+    background_symbols = []
+    monkeypatch.setattr('project.prices.start_background_refresh',
+                        lambda symbols: background_symbols.extend(symbols))
+
+    priced_yesterday = Stock('AAPL', '16', '406.78', 7, datetime(2022, 2, 12))
+    priced_yesterday.current_price = 150.0
+    priced_yesterday.current_price_date = datetime.now() - timedelta(days=1)
+    never_priced = Stock('MSFT', '2', '302.38', 7, datetime(2022, 2, 10))
+
+    with test_client.application.app_context():
+        stale_stocks = revalidate_stock_prices([priced_yesterday, never_priced])
+
+    assert stale_stocks == [priced_yesterday]
+    assert priced_yesterday.current_price == 150.0
+    assert never_priced.current_price == 148.34
+    assert background_symbols == ['AAPL']
+
+
+def test_update_stored_stock_prices(test_client, create_users):
+    """
+    GIVEN a Flask application configured for testing and three lots holding two distinct symbols
+    WHEN the fetched prices are stored
+    THEN check that every lot holding a symbol is updated by the bulk update and a price of 0.0 is ignored
+    """
+    with test_client.application.app_context():
+        user_ids = create_users(3)
+        stocks = [Stock('ORCL', '16', '406.78', user_ids[0], datetime(2022, 2, 12)),
+                  Stock('orcl', '4', '398.12', user_ids[1], datetime(2021, 5, 3)),
+                  Stock('INTC', '10', '151.00', user_ids[2], datetime(2020, 1, 6))]
+        db.session.add_all(stocks)
+        db.session.commit()
+
+        assert update_stored_stock_prices({'ORCL': 82.5, 'INTC': 0.0}) == 1
+
+        orcl_stocks = Stock.query.filter(db.func.upper(Stock.stock_symbol) == 'ORCL').all()
+        assert len(orcl_stocks) == 2
+        for stock in orcl_stocks:
+            assert stock.current_price == 82.5
+            assert stock.current_price_date.date() == datetime.now().date()
+            assert stock.position_value == 82.5 * stock.number_of_shares
+
+        intc_stock = Stock.query.filter_by(stock_symbol='INTC').first()
+        assert intc_stock.current_price == 0
+        assert intc_stock.current_price_date is None
+
+        for stock in orcl_stocks + [intc_stock]:
+            db.session.delete(stock)
+        db.session.commit()
@@ -0,0 +1,103 @@
+"""
+This file (test_rate_limit.py) contains the unit tests for the rate_limit.py file.
+"""
+from sqlalchemy import create_engine
+
+from project.models import TokenBucket
+from project.rate_limit import (BACKGROUND, INTERACTIVE, DatabaseBucketStore, PriorityScheduler, RateLimiter,
+                                SQLiteBucketStore)
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limiter_calls_per_minute():
+    """
+    GIVEN a RateLimiter allowing 5 calls per minute
+    WHEN 6 calls are made at once and then 12 seconds later
+    THEN check that the 6th call has to wait until a token is refilled
+    """
+    timer = FakeTimer()
+    limiter = RateLimiter([(5, 60)], timer=timer)
+    for _ in range(5):
+        assert limiter.try_acquire() == 0.0
+    assert limiter.try_acquire() == 12.0
+
+    timer.now += 12
+    assert limiter.try_acquire() == 0.0
+
+
+def test_rate_limiter_shared_between_processes(tmp_path):
+    """
+    GIVEN two RateLimiters using the same SQLite file (like two gunicorn workers)
+    WHEN the first limiter uses up the calls
+    THEN check that the second limiter has to wait too
+    """
+    timer = FakeTimer()
+    path = str(tmp_path / 'rate_limit.sqlite')
+    limiter1 = RateLimiter([(2, 60), (500, 86400)], SQLiteBucketStore(path), timer=timer)
+    limiter2 = RateLimiter([(2, 60), (500, 86400)], SQLiteBucketStore(path), timer=timer)
+    assert limiter1.try_acquire() == 0.0
+    assert limiter1.try_acquire() == 0.0
+    assert limiter2.try_acquire() > 0.0
+
+
+def test_rate_limiter_shared_through_the_database(tmp_path):
+    """
+    GIVEN two RateLimiters storing their buckets in the same database (like the web and worker dynos)
+    WHEN the first limiter uses up the calls
+    THEN check that the second limiter has to wait too
+    """
+    timer = FakeTimer()
+    engine = create_engine(f'sqlite:///{tmp_path / "rate_limit.db"}')
+    TokenBucket.__table__.create(engine)
+    limiter1 = RateLimiter([(2, 60), (500, 86400)], DatabaseBucketStore(engine, TokenBucket.__table__), timer=timer)
+    limiter2 = RateLimiter([(2, 60), (500, 86400)], DatabaseBucketStore(engine, TokenBucket.__table__), timer=timer)
+    assert limiter1.try_acquire() == 0.0
+    assert limiter1.try_acquire() == 0.0
+    assert limiter2.try_acquire() > 0.0
+
+    timer.now += 30
+    assert limiter2.try_acquire() == 0.0
+    engine.dispose()
+
+
+def test_rate_limiter_drain():
+    """
+    GIVEN a RateLimiter with calls available
+    WHEN Alpha Vantage reports that the calls are throttled
+    THEN check that the next call has to wait
+    """
+    limiter = RateLimiter([(5, 60), (500, 86400)], timer=FakeTimer())
+    limiter.drain()
+    assert limiter.try_acquire() == 12.0
+
+
+def test_priority_scheduler_reserves_tokens_for_interactive_calls():
+    """
+    GIVEN a PriorityScheduler keeping one token for interactive calls
+    WHEN a background call and an interactive call are made with one token left
+    THEN check that only the interactive call gets the token
+    """
+    limiter = RateLimiter([(2, 3600)])
+    scheduler = PriorityScheduler(limiter, background_reserve=1)
+    assert scheduler.acquire(BACKGROUND, timeout=0.01)
+    assert not scheduler.acquire(BACKGROUND, timeout=0.01)
+    assert scheduler.acquire(INTERACTIVE, timeout=0.01)
+    assert not scheduler.acquire(INTERACTIVE, timeout=0.01)
+
+
+def test_rate_limiter_disabled():
+    """
+    GIVEN a RateLimiter without limits
+    WHEN many calls are made
+    THEN check that no call has to wait
+    """
+    limiter = RateLimiter([(0, 60), (0, 86400)])
+    for _ in range(100):
+        assert limiter.try_acquire() == 0.0
@@ -0,0 +1,60 @@
+"""
+This file (test_single_flight.py) contains the unit tests for the single_flight.py file.
+"""
+import threading
+import time
+
+import pytest
+
+from project.single_flight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """
+    GIVEN a SingleFlight object
+    WHEN ten threads ask for the same key at the same time
+    THEN check that the function is called once and every thread gets its result
+    """
+    flights = SingleFlight()
+    calls = []
+    results = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 148.34
+
+    def worker():
+        results.append(flights.do('AAPL', fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [148.34] * 10
+    assert flights.in_flight() == 0
+
+
+def test_single_flight_shares_exceptions(tmp_path):
+    """
+    GIVEN a SingleFlight object using lock files
+    WHEN the function raises an exception
+    THEN check that the exception is raised and the next call is made again
+    """
+    flights = SingleFlight()
+
+    def failing_fetch():
+        raise ValueError('bad')
+
+    with pytest.raises(ValueError):
+        flights.do('AAPL', failing_fetch, lock_dir=str(tmp_path))
+
+    assert flights.do('AAPL', lambda: 148.34, lock_dir=str(tmp_path)) == 148.34
+    assert (tmp_path / 'AAPL.lock').exists()
@@ -0,0 +1,74 @@
+"""
+This file (test_static_assets.py) contains the unit tests for the static_assets.py file.
+"""
+import gzip
+import json
+
+from flask import Flask, url_for
+
+from project.static_assets import configure_static_assets
+
+
+def create_test_app(static_folder):
+    app = Flask(__name__, static_folder=str(static_folder))
+    configure_static_assets(app)
+    return app
+
+
+def test_build_and_serve_fingerprinted_static_files(tmp_path):
+    """
+    GIVEN a static folder with a stylesheet and an image, built by the 'flask build-static' command
+    WHEN the URLs of the static files are generated and the files are requested with and without gzip
+    THEN check that the fingerprinted files are linked and served compressed when accepted, with an immutable Cache-Control
+    """
+    static_folder = tmp_path / 'static'
+    (static_folder / 'css').mkdir(parents=True)
+    (static_folder / 'img').mkdir()
+    stylesheet = b'body {\n    color: black;\n}\n' * 50
+    (static_folder / 'css' / 'base_style.css').write_bytes(stylesheet)
+    (static_folder / 'img' / 'logo.png').write_bytes(b'\x89PNG not really')
+
+    result = create_test_app(static_folder).test_cli_runner().invoke(args=['build-static'])
+    assert result.exit_code == 0
+    assert 'Built 2 static files' in result.output
+    manifest = json.loads((static_folder / 'build' / 'manifest.json').read_text())
+    assert set(manifest) == {'css/base_style.css', 'img/logo.png'}
+    assert (static_folder / (manifest['css/base_style.css'] + '.gz')).exists()
+    assert not (static_folder / (manifest['img/logo.png'] + '.gz')).exists()
+
+    app = create_test_app(static_folder)
+    with app.test_request_context():
+        url = url_for('static', filename='css/base_style.css')
+    assert url == '/static/' + manifest['css/base_style.css']
+
+    client = app.test_client()
+    res = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert res.status_code == 200
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.mimetype == 'text/css'
+    assert 'immutable' in res.headers['Cache-Control']
+    assert 'max-age=31536000' in res.headers['Cache-Control']
+    assert gzip.decompress(res.data) == stylesheet
+
+    res = client.get(url)
+    assert 'Content-Encoding' not in res.headers
+    assert res.data == stylesheet
+
+    res = client.get('/static/css/base_style.css')
+    assert res.status_code == 200
+    assert 'immutable' not in res.headers.get('Cache-Control', '')
+
+
+def test_static_files_not_built(tmp_path):
+    """
+    GIVEN a static folder whose fingerprinted files were not built
+    WHEN the URL of a static file is generated
+    THEN check that the URL of the original file is returned
+    """
+    static_folder = tmp_path / 'static'
+    static_folder.mkdir()
+    (static_folder / 'app.js').write_text('console.log("Kozuki-IO");')
+
+    app = create_test_app(static_folder)
+    with app.test_request_context():
+        assert url_for('static', filename='app.js') == '/static/app.js'
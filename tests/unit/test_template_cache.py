@@ -0,0 +1,53 @@
+"""
+This file (test_template_cache.py) contains the unit tests for the template_cache.py file.
+"""
+from flask import Flask
+
+from project.template_cache import configure_template_cache
+
+
+def create_test_app(tmp_path, **config):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'base.html').write_text('<h1>{% block title %}{% endblock %}</h1>')
+    (templates / 'page.html').write_text('{% extends "base.html" %}{% block title %}{{ name }}{% endblock %}')
+
+    app = Flask(__name__, template_folder=str(templates))
+    app.config.update(config)
+    configure_template_cache(app)
+    return app
+
+
+def test_precompile_templates_into_the_bytecode_cache(tmp_path):
+    """
+    GIVEN a Flask application with a template bytecode cache directory
+    WHEN the 'flask precompile-templates' command is run
+    THEN check that every template is compiled into the cache directory, and used by another application
+    """
+    cache_dir = tmp_path / 'jinja_cache'
+    app = create_test_app(tmp_path, TEMPLATE_BYTECODE_CACHE_DIR=str(cache_dir))
+
+    result = app.test_cli_runner().invoke(args=['precompile-templates'])
+    assert result.exit_code == 0
+    assert 'Compiled 2 templates' in result.output
+    assert len(list(cache_dir.iterdir())) == 2
+
+    other_app = Flask(__name__, template_folder=str(tmp_path / 'templates'))
+    other_app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = str(cache_dir)
+    configure_template_cache(other_app)
+    compiled = []
+    other_app.jinja_env.compile = lambda *args, **kwargs: compiled.append(args)
+    with other_app.app_context():
+        assert other_app.jinja_env.get_template('page.html').render(name='Portfolio') == '<h1>Portfolio</h1>'
+    assert compiled == []
+
+
+def test_precompile_templates_on_startup(tmp_path):
+    """
+    GIVEN a Flask application configured to precompile its templates, without a bytecode cache
+    WHEN the application is configured
+    THEN check that the templates are already in the template cache of the application
+    """
+    app = create_test_app(tmp_path, TEMPLATE_PRECOMPILE=True)
+    assert app.jinja_env.bytecode_cache is None
+    assert {name for _, name in app.jinja_env.cache.keys()} == {'base.html', 'page.html'}